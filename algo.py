@@ -1,75 +1,347 @@
+import hashlib
 import json
-from collections import deque
+import shutil
+import tempfile
+import time
+from pathlib import Path
 from heapq import heappush, heappop
+import numpy as np
+import instrument
+
+# sentinel for chain costs that do not exist, small enough that adding costs cannot overflow int32
+UNREACHABLE = 1 << 24
+
+class ChainSearchExhausted(Exception):
+    """
+    find_chain_ids ran out of expansions before proving which chain is cheapest,
+    best_path is the cheapest chain found until then or None
+    """
+    def __init__(self, best_path: list[int] | None):
+        super().__init__("chain search ran out of expansions")
+        self.best_path = best_path
 
 class AspectRelations:
     """
     Adjacency list graph where each node has some cost
+
+    Aspects are interned to ids (their order in aspects.json). Searches run on the ids,
+    the CSR arrays adj_offsets/adj_targets and cost_array, names only appear at the API.
+
+    addon_files are extra JSON packs in the aspects.json format, merged in order over it.
+    The arrays and chain tables are compiled once into a snapshot of .npy files under
+    cache_dir, named by a hash of the sources, and later instances memory map it instead of
+    parsing the JSON again. Pickled instances are rebuilt from the snapshot the same way,
+    so process pool workers share it too. cache_dir None always builds from the JSON, and so
+    does a cache_dir that can't be written, without saving. Saving a snapshot deletes the
+    snapshots of other sources.
     """
-    def __init__(self):
+    SNAPSHOT_VERSION = 2
+    SNAPSHOT_ARRAYS = ["aspect_names", "cost_array", "adj_offsets", "adj_targets", "component_offsets", "component_targets",
+                       "aspect_distances", "chain_costs", "chain_next", "chain_lower_bounds"]
+    # search budget of find_chain_ids once the cheapest chain repeats an aspect, which most chains past ~10 hops do
+    MAX_CHAIN_EXPANSIONS = 20000
+
+    def __init__(self, max_chain_length: int = 20, addon_files: list[str | Path] = [], cache_dir: str | Path | None = Path(__file__).with_name(".aspect_cache")):
+        self.max_chain_length = max_chain_length
+        self.addon_files = [Path(f) for f in addon_files]
+        self.cache_dir = None if cache_dir == None else Path(cache_dir)
+        self.aspect_names : list[str] = []
+        self.aspect_ids : dict[str, int] = {}
+        self.cost_array : np.ndarray = np.zeros(0, dtype=np.int32)
+        # neighbors of id i are adj_targets[adj_offsets[i]:adj_offsets[i + 1]]
+        self.adj_offsets : np.ndarray = np.zeros(1, dtype=np.int32)
+        self.adj_targets : np.ndarray = np.zeros(0, dtype=np.int32)
+        # components (children) of id i are component_targets[component_offsets[i]:component_offsets[i + 1]]
+        self.component_offsets : np.ndarray = np.zeros(1, dtype=np.int32)
+        self.component_targets : np.ndarray = np.zeros(0, dtype=np.int32)
+        # chain_costs[length, start, end] -> cheapest chain cost, see _extend_chain_table
+        self.chain_costs : np.ndarray = np.zeros((0, 0, 0), dtype=np.int32)
+        # chain_next[length, start, end] -> the aspect after start on that cheapest chain, -1 for none
+        self.chain_next : np.ndarray = np.zeros((0, 0, 0), dtype=np.int32)
+        # chain_lower_bounds[length, start, end] -> least cost between the ends of any chain at least that long
+        self.chain_lower_bounds : np.ndarray = np.zeros((0, 0, 0), dtype=np.int32)
+        # aspect_distances[start, end] -> fewest hops between two aspects, UNREACHABLE if none
+        self.aspect_distances : np.ndarray = np.zeros((0, 0), dtype=np.int32)
+
+        # string lookups, useful for displaying in UI
         self.aspect_relations : dict[str, set[str]] = {}
         self.aspect_costs : dict[str, int] = {}
-        # useful for displaying in UI
         self.aspect_parents : dict[str, set[str]] = {}
         self.aspect_children : dict[str, set[str]] = {}
 
-        self._build()
-        
+        snapshot = None if self.cache_dir == None else self.cache_dir / self.source_hash()
+        if (snapshot == None or not snapshot.is_dir() or not self._load_snapshot(snapshot)):
+            self._build()
+            self._extend_chain_table(max_chain_length)
+            if (snapshot != None):
+                self._save_snapshot(snapshot)
+        self._build_lookups()
+
+    def __reduce__(self):
+        return (AspectRelations, (self.max_chain_length, self.addon_files, self.cache_dir))
+
+    def source_files(self) -> list[Path]:
+        return [Path(__file__).with_name('aspects.json')] + self.addon_files
+
+    def source_hash(self) -> str:
+        digest = hashlib.sha256(f"{self.SNAPSHOT_VERSION} {self.max_chain_length}".encode("utf-8"))
+        for path in self.source_files():
+            digest.update(path.read_bytes())
+        return digest.hexdigest()[:16]
+
+    def _load_snapshot(self, snapshot: Path) -> bool:
+        # read only memory maps, pages are shared between processes loading the same snapshot
+        try:
+            arrays = {name: np.asarray(np.load(snapshot / f"{name}.npy", mmap_mode="r")) for name in self.SNAPSHOT_ARRAYS}
+        except (OSError, ValueError):
+            # deleted by a process saving newer sources, or unreadable
+            return False
+        for name, value in arrays.items():
+            setattr(self, name, value)
+        self.aspect_names = [str(a) for a in self.aspect_names]
+        self.aspect_ids = {a: i for i, a in enumerate(self.aspect_names)}
+        return True
+
+    def _save_snapshot(self, snapshot: Path):
+        # written to a temporary directory and renamed, so a concurrent loader never sees half of it
+        try:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            staging = Path(tempfile.mkdtemp(dir=self.cache_dir))
+        except OSError:
+            # read only location, the build stays in memory
+            return
+        try:
+            for name in self.SNAPSHOT_ARRAYS:
+                value = np.array(self.aspect_names) if name == "aspect_names" else getattr(self, name)
+                np.save(staging / f"{name}.npy", value)
+            staging.rename(snapshot)
+        except OSError:
+            # another process saved the same snapshot first, or the disk is full
+            shutil.rmtree(staging, ignore_errors=True)
+            return
+        # snapshots of older sources are never loaded again, staging directories start with "tmp"
+        for stale in self.cache_dir.iterdir():
+            if (stale != snapshot and stale.is_dir() and not stale.name.startswith("tmp")):
+                shutil.rmtree(stale, ignore_errors=True)
+
     def _build(self):
-        with open('aspects.json') as aspects_file:
-            data = json.load(aspects_file)
+        data : dict[str, list[str] | None] = {}
+        for path in self.source_files():
+            with open(path) as aspects_file:
+                data.update(json.load(aspects_file))
+        costs : dict[str, int] = {}
+        relations : dict[str, set[str]] = {}
         for aspect, components in data.items():
             components = list(components or [])
-            self.aspect_costs[aspect] = 1 + sum([self.aspect_costs.get(c, 0) for c in components])
+            costs[aspect] = 1 + sum([costs.get(c, 0) for c in components])
             for component in components:
-                self.aspect_relations.setdefault(component, set()).add(aspect)
-                self.aspect_relations.setdefault(aspect, set()).add(component)
+                relations.setdefault(component, set()).add(aspect)
+                relations.setdefault(aspect, set()).add(component)
+
+        self.aspect_names = [a for a in data if a in relations]
+        self.aspect_ids = {a: i for i, a in enumerate(self.aspect_names)}
+        self.cost_array = np.array([costs[a] for a in self.aspect_names], dtype=np.int32)
+        targets = [sorted(self.aspect_ids[n] for n in relations[a]) for a in self.aspect_names]
+        self.adj_offsets = np.zeros(len(targets) + 1, dtype=np.int32)
+        self.adj_offsets[1:] = np.cumsum([len(t) for t in targets])
+        self.adj_targets = np.array([n for t in targets for n in t], dtype=np.int32)
+        components = [[self.aspect_ids[c] for c in data[a] or []] for a in self.aspect_names]
+        self.component_offsets = np.zeros(len(components) + 1, dtype=np.int32)
+        self.component_offsets[1:] = np.cumsum([len(c) for c in components])
+        self.component_targets = np.array([c for cs in components for c in cs], dtype=np.int32)
 
-                self.aspect_parents.setdefault(component, set()).add(aspect)
-                self.aspect_children.setdefault(aspect, set()).add(component)
+        count = len(self.aspect_names)
+        related = np.zeros((count, count), dtype=np.int32)
+        related[np.repeat(np.arange(count), np.diff(self.adj_offsets)), self.adj_targets] = 1
+        self.aspect_distances = np.full((count, count), UNREACHABLE, dtype=np.int32)
+        reached = np.eye(count, dtype=bool)
+        frontier = reached
+        level = 0
+        while frontier.any():
+            self.aspect_distances[frontier] = level
+            level += 1
+            frontier = (frontier.astype(np.int32) @ related > 0) & ~reached
+            reached = reached | frontier
+
+    def _build_lookups(self):
+        names = self.aspect_names
+        offsets = self.adj_offsets.tolist()
+        targets = self.adj_targets.tolist()
+        component_offsets = self.component_offsets.tolist()
+        component_targets = self.component_targets.tolist()
+        self.aspect_costs = dict(zip(names, self.cost_array.tolist()))
+        for i, aspect in enumerate(names):
+            self.aspect_relations[aspect] = {names[n] for n in targets[offsets[i]:offsets[i + 1]]}
+            for component in component_targets[component_offsets[i]:component_offsets[i + 1]]:
+                self.aspect_parents.setdefault(names[component], set()).add(aspect)
+                self.aspect_children.setdefault(aspect, set()).add(names[component])
 
     def neighbors(self, aspect: str):
         return list(self.aspect_relations.get(aspect, []))
 
+    def neighbor_ids(self, aspect_id: int) -> np.ndarray:
+        return self.adj_targets[self.adj_offsets[aspect_id]:self.adj_offsets[aspect_id + 1]]
+
     def all_nodes(self):
-        return list(self.aspect_relations.keys())
+        return list(self.aspect_names)
 
-    def find_path_exact_length(self, start: str, end: str, length: int) -> list[str] | None:
-        if length < 0 or start not in self.aspect_relations or end not in self.aspect_relations:
+    def _extend_chain_table(self, length: int):
+        """
+        Layered DP over chain lengths: chain_costs[n, a, b] is the cost of the cheapest
+        n-hop chain of related aspects from a to b, counting both ends, or UNREACHABLE.
+        chain_next[n, a, b] is its second aspect, so the chain is read back hop by hop.
+        Chains may revisit aspects, so every entry is a lower bound for the matching simple chain.
+        """
+        count = len(self.aspect_names)
+        if len(self.chain_costs) == 0:
+            first = np.full((1, count, count), UNREACHABLE, dtype=np.int32)
+            first[0, np.arange(count), np.arange(count)] = self.cost_array
+            self.chain_costs = first
+            self.chain_next = np.full((1, count, count), -1, dtype=np.int32)
+        if len(self.chain_costs) > length:
+            return
+        layers = [self.chain_costs]
+        next_layers = [self.chain_next]
+        previous = self.chain_costs[-1]
+        width = len(self.adj_targets)
+        for _ in range(len(self.chain_costs), length + 1):
+            # cheapest continuation over each aspect's neighbors, one CSR segment per aspect,
+            # with the CSR position kept as the remainder to recover the neighbor
+            encoded = previous[self.adj_targets].astype(np.int64) * width + np.arange(width)[:, None]
+            continuation = np.minimum.reduceat(encoded, self.adj_offsets[:-1], axis=0)
+            layer = np.minimum(continuation // width + self.cost_array[:, None], UNREACHABLE).astype(np.int32)
+            chain_next = self.adj_targets[continuation % width].astype(np.int32)
+            empty = self.adj_offsets[:-1] == self.adj_offsets[1:]
+            layer[empty] = UNREACHABLE
+            chain_next[empty] = -1
+            chain_next[layer >= UNREACHABLE] = -1
+            layers.append(layer[None])
+            next_layers.append(chain_next[None])
+            previous = layer
+        self.chain_costs = np.concatenate(layers)
+        self.chain_next = np.concatenate(next_layers)
+
+        # a chain longer than the table costs at least its length in intermediates
+        max_length = len(self.chain_costs) - 1
+        at_least = np.minimum.accumulate(self.chain_costs[::-1], axis=0)[::-1].astype(np.int64)
+        bounds = np.minimum(at_least - self.cost_array[:, None] - self.cost_array[None, :], max_length).clip(0)
+        bounds[:, self.aspect_distances >= UNREACHABLE] = UNREACHABLE
+        self.chain_lower_bounds = bounds.astype(np.int32)
+
+    @instrument.instrumented("find_path_exact_length")
+    def find_path_exact_length(self, start: str, end: str, length: int, max_expansions: int | None = MAX_CHAIN_EXPANSIONS) -> list[str] | None:
+        if start not in self.aspect_ids or end not in self.aspect_ids:
+            return None
+        path = self.find_chain_ids(self.aspect_ids[start], self.aspect_ids[end], length, max_expansions)
+        if path is None:
+            return None
+        return [self.aspect_names[x] for x in path]
+
+    def find_chain_ids(self, start: int, end: int, length: int, max_expansions: int | None = MAX_CHAIN_EXPANSIONS) -> list[int] | None:
+        """
+        Cheapest simple chain of exactly length hops from start to end, None if there is none.
+        Read back from chain_next when the cheapest chain is simple, otherwise searched, raising
+        ChainSearchExhausted after max_expansions, None searches without a limit.
+        """
+        if length < 0:
             return None
         if length == 0:
             return [start] if start == end else None
+        if start == end:
+            return None
+
+        self._extend_chain_table(length)
+        if self.chain_costs[length, start, end] >= UNREACHABLE:
+            return None
+
+        # the cheapest chain read back from the table, it is the answer unless it repeats an aspect
+        path = [start]
+        for remaining in range(length, 0, -1):
+            path.append(int(self.chain_next[remaining, path[-1], end]))
+        if len(set(path)) == len(path):
+            instrument.count_search(length, length)
+            return path
 
+        # depth first over simple chains, cheapest lower bound first, pruned by the chain table
         best_path = None
-        best_cost = 99999999
+        best_cost = UNREACHABLE
+        # per query, pull the table column for end and the CSR arrays into plain lists,
+        # scalar indexing into numpy is far slower than the hashing it replaces
+        to_end = self.chain_costs[:length, :, end].tolist()
+        costs = self.cost_array.tolist()
+        offsets = self.adj_offsets.tolist()
+        targets = self.adj_targets.tolist()
+        path = [start]
+        used = 1 << start
+        expanded = 0
 
-        queue = deque([(start, [start])])
-        while queue:
-            node, path = queue.popleft()
-            path_length = len(path) - 1
-            if path_length >= length:
-                if node == end:
-                    path_cost = sum([self.aspect_costs[x] for x in path])
-                    if (path_cost < best_cost):
-                        best_cost = path_cost
-                        best_path = path
-                continue
-            for neighbor in self.aspect_relations.get(node, []):
-                if neighbor in path:
+        def visit(node: int, prefix_cost: int, remaining: int):
+            nonlocal best_path, best_cost, used, expanded
+            expanded += 1
+            if max_expansions != None and expanded > max_expansions:
+                raise ChainSearchExhausted(best_path)
+            if remaining == 0:
+                best_path = list(path)
+                best_cost = prefix_cost + costs[node]
+                return
+            prefix_cost += costs[node]
+            bounds = to_end[remaining - 1]
+            candidates = sorted((prefix_cost + bounds[n], n) for n in targets[offsets[node]:offsets[node + 1]])
+            for bound, neighbor in candidates:
+                if bound >= best_cost:
+                    break
+                if used >> neighbor & 1:
                     continue
-                queue.append((neighbor, path + [neighbor]))
+                path.append(neighbor)
+                used |= 1 << neighbor
+                visit(neighbor, prefix_cost, remaining - 1)
+                used &= ~(1 << neighbor)
+                path.pop()
+
+        try:
+            visit(start, 0, length)
+        finally:
+            instrument.count_search(expanded, length)
         return best_path
 
+def mask_ids(mask: int):
+    """
+    Yields the ids of the set bits in mask, lowest first
+    """
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
 class HexGrid:
     """
     Axial hex coordinates (q, r)
+
+    Node sets are int bitmasks with bit i standing for node id i: neighbor_masks[i] holds the
+    neighbors of node i and disabled_mask the disabled nodes.
+
+    distances is the all pairs hop count matrix over the enabled nodes, UNREACHABLE between
+    separated nodes and for disabled ones. It is built on first use and then kept up to date
+    by disable_id/enable_id. A grid and its copies share the last matrix built for their
+    disabled cells, so solves on copies of an unchanged grid only build it once, and a copy
+    with a few cells toggled since updates that matrix instead of building its own.
     """
+    # toggled cells up to which distances updates the cached matrix instead of building a new one
+    MAX_DERIVED_CHANGES = 8
+
     def __init__(self, radius: int):
         self.radius = max(0, radius - 1)
         self.id_to_coord : dict[int, (int,int)] = {}
         self.coord_to_id : dict[(int,int), int] = {}
         self.adj : dict[int, list[int]] = {}
-        self.disabled_nodes : set[int] = set()
+        self.neighbor_masks : list[int] = []
+        self.node_mask : int = 0
+        self.disabled_mask : int = 0
+        # neighbor ids padded with node_count(), the id of an always unreachable extra column
+        self.neighbor_index : np.ndarray = np.zeros((0, 6), dtype=np.int64)
+        self._distances : np.ndarray | None = None
+        # disabled_mask -> read only distances, the same dict in every copy of this grid
+        self._distance_cache : dict[int, np.ndarray] = {}
         self._build()
 
     def _build(self):
@@ -85,85 +357,664 @@ class HexGrid:
                 self.coord_to_id[coord] = nid
                 self.adj[nid] = []
                 nid += 1
+        self.node_mask = (1 << nid) - 1
 
         # axial neighbor directions
         dirs = [(1, 0), (1, -1), (0, -1), (-1, 0), (-1, 1), (0, 1)]
         for i, coord in self.id_to_coord.items():
             q, r = coord
+            mask = 0
             for dq, dr in dirs:
                 ncoord = (q + dq, r + dr)
                 if ncoord in self.coord_to_id:
                     nid = self.coord_to_id[ncoord]
                     self.adj[i].append(nid)
+                    mask |= 1 << nid
+            self.neighbor_masks.append(mask)
+        count = len(self.id_to_coord)
+        self.neighbor_index = np.array([self.adj[i] + [count] * (6 - len(self.adj[i])) for i in range(count)], dtype=np.int64).reshape(count, 6)
+
+    @property
+    def disabled_nodes(self) -> set[int]:
+        return set(mask_ids(self.disabled_mask))
+
+    def is_disabled(self, node_id: int) -> bool:
+        return bool(self.disabled_mask >> node_id & 1)
+
+    def nodes_to_mask(self, nodes) -> int:
+        mask = 0
+        for node in nodes:
+            if (node in self.id_to_coord):
+                mask |= 1 << node
+        return mask
+
+    def copy(self) -> 'HexGrid':
+        # the layout is never mutated after _build, only the disabled nodes and distances need
+        # copying, read only distances are copied once either grid changes them
+        grid = HexGrid.__new__(HexGrid)
+        grid.__dict__.update(self.__dict__)
+        if (self._distances is not None and self._distances.flags.writeable):
+            grid._distances = self._distances.copy()
+        return grid
+
+    def __getstate__(self):
+        # process pool workers get the grid's own matrix, not the cache next to it
+        state = dict(self.__dict__)
+        state["_distance_cache"] = {}
+        return state
 
     def disable_id(self, node_id: int):
-        if (node_id in self.id_to_coord):
-            self.disabled_nodes.add(node_id)
+        if (node_id in self.id_to_coord and not self.is_disabled(node_id)):
+            self.disabled_mask |= 1 << node_id
+            if (self._distances is not None):
+                self._writeable_distances()
+                self._disable_distances(node_id)
 
     def enable_id(self, node_id: int):
-        if (node_id in self.disabled_nodes):
-            self.disabled_nodes.remove(node_id)
+        if (node_id in self.id_to_coord and self.is_disabled(node_id)):
+            self.disabled_mask &= ~(1 << node_id)
+            if (self._distances is not None):
+                self._writeable_distances()
+                self._enable_distances(node_id)
+
+    @property
+    def distances(self) -> np.ndarray:
+        if (self._distances is None):
+            # one lookup, another thread may clear the cache in between
+            self._distances = self._distance_cache.get(self.disabled_mask)
+        if (self._distances is None and self.disabled_mask == 0):
+            # nothing in the way, plain hex distances
+            coords = np.array([self.id_to_coord[i] for i in range(len(self.id_to_coord))], dtype=np.int32).reshape(-1, 2)
+            dq = coords[:, None, 0] - coords[None, :, 0]
+            dr = coords[:, None, 1] - coords[None, :, 1]
+            self._distances = (np.abs(dq) + np.abs(dr) + np.abs(dq + dr)) // 2
+        elif (self._distances is None):
+            self._distances = self._derived_distances()
+            if (self._distances is None):
+                self._distances = self._bfs_rows(np.arange(len(self.id_to_coord)))
+            # one entry, the copies of a grid in use all have the same disabled cells
+            self._distances.flags.writeable = False
+            self._distance_cache.clear()
+            self._distance_cache[self.disabled_mask] = self._distances
+        return self._distances
+
+    def _derived_distances(self) -> np.ndarray | None:
+        # after a few cells were toggled the cached matrix updated cell by cell is cheaper than a rebuild,
+        # unless a disabled cell changes most rows, then _disable_distances would rebuild it anyway
+        for mask, cached in list(self._distance_cache.items()):
+            changed = mask ^ self.disabled_mask
+            if (changed.bit_count() > self.MAX_DERIVED_CHANGES):
+                continue
+            grid = self.copy()
+            grid.disabled_mask = mask
+            grid._distances = cached
+            for node in mask_ids(changed & self.disabled_mask):
+                if (len(grid._rows_through(node)) > len(self.id_to_coord) // 2):
+                    return None
+                grid.disable_id(node)
+            for node in mask_ids(changed & ~self.disabled_mask):
+                grid.enable_id(node)
+            return grid._distances
+        return None
+
+    def _writeable_distances(self):
+        if (not self._distances.flags.writeable):
+            self._distances = self._distances.copy()
+
+    def _bfs_rows(self, sources: np.ndarray) -> np.ndarray:
+        """
+        Hop counts from each of sources to every node over enabled nodes, all sources at once.
+        The frontier is kept as flat (row, node) indices, so every pair is expanded once and
+        the work stays quadratic in the grid size however long the paths get.
+        """
+        count = len(self.id_to_coord)
+        enabled = np.zeros(count + 1, dtype=bool)
+        enabled[list(mask_ids(self.enabled_mask()))] = True
+        distances = np.full(len(sources) * count, UNREACHABLE, dtype=np.int32)
+        reached = np.zeros(len(sources) * count, dtype=bool)
+        rows = np.flatnonzero(enabled[sources])
+        frontier = rows * count + np.asarray(sources)[rows]
+        level = 0
+        while len(frontier):
+            distances[frontier] = level
+            reached[frontier] = True
+            level += 1
+            neighbors = self.neighbor_index[frontier % count]
+            flat = (frontier // count * count)[:, None] + neighbors
+            flat = flat[enabled[neighbors]]
+            frontier = np.unique(flat[~reached[flat]])
+        return distances.reshape(len(sources), count)
+
+    def _enable_distances(self, node_id: int):
+        # every new shortest path runs through node_id once, a min-plus update through it covers them
+        distances = self._distances
+        through = np.minimum(distances[self.neighbor_index[node_id][self.neighbor_index[node_id] < len(self.id_to_coord)]].min(axis=0, initial=UNREACHABLE) + 1, UNREACHABLE)
+        through[node_id] = 0
+        np.minimum(distances, through[:, None] + through[None, :], out=distances)
+        distances[distances > UNREACHABLE] = UNREACHABLE
+
+    def _disable_distances(self, node_id: int):
+        # only rows with a shortest path through node_id change, search those again.
+        # Near the middle of the grid that is most rows, then one search over all of them is cheaper
+        distances = self._distances
+        count = len(self.id_to_coord)
+        rows = self._rows_through(node_id)
+        if (len(rows) > count // 2):
+            self._distances = self._bfs_rows(np.arange(count))
+            return
+        distances[node_id, :] = UNREACHABLE
+        distances[:, node_id] = UNREACHABLE
+        if (len(rows)):
+            distances[rows] = self._bfs_rows(rows)
+            distances[:, rows] = distances[rows].T
+
+    def _rows_through(self, node_id: int) -> np.ndarray:
+        # the nodes with a shortest path to some other node through node_id
+        distances = self._distances
+        to_node = distances[:, node_id]
+        reachable = to_node < UNREACHABLE
+        via = (to_node[:, None] + to_node[None, :] == distances) & reachable[:, None] & reachable[None, :]
+        via[:, node_id] = False
+        via[node_id, :] = False
+        return np.flatnonzero(via.any(axis=1))
+
+    def enabled_mask(self) -> int:
+        return self.node_mask & ~self.disabled_mask
+
+    def neighbor_mask(self, node_id: int) -> int:
+        return self.neighbor_masks[node_id] & ~self.disabled_mask
 
     def neighbors(self, node_id: int):
-        return list([x for x in self.adj.get(node_id, []) if not x in self.disabled_nodes])
+        if (node_id not in self.id_to_coord):
+            return []
+        return list(mask_ids(self.neighbor_mask(node_id)))
 
     def node_count(self):
-        return len([x for x in self.adj if not x in self.disabled_nodes])
+        return self.enabled_mask().bit_count()
 
     def all_nodes(self):
-        return list([x for x in self.adj.keys() if not x in self.disabled_nodes])
+        return list(mask_ids(self.enabled_mask()))
     
+    @instrument.instrumented("find_path_minimum_length")
     def find_path_minimum_length(self, start: int, ends: list[int], minimum_length: int, additional_excludes: list[int] = []) -> list[int] | None:
+        """
+        Shortest simple path from start to one of ends with at least minimum_length nodes,
+        only the last node may be in ends and no node may be in additional_excludes
+        """
+        search = self._path_search_masks(start, ends, additional_excludes)
+        if (search == None):
+            return None
+        return self._search_paths(start, *search, max(1, minimum_length - 1), self.node_count())
+
+    def _path_search_masks(self, start: int, ends: list[int], additional_excludes: list[int]) -> tuple[int, int] | None:
         if (start in ends):
             return None
-        if start not in self.adj or start in self.disabled_nodes:
+        if start not in self.id_to_coord or self.is_disabled(start):
             return None
-        targets = {end for end in ends if end in self.adj and end not in self.disabled_nodes}
-        if not targets:
+        target_mask = self.nodes_to_mask(ends) & ~self.disabled_mask
+        if not target_mask:
             return None
-        
-        additional_excludes.remove(start)
-        for x in ends:
-            additional_excludes.remove(x)
+        blocked_mask = (self.disabled_mask | self.nodes_to_mask(additional_excludes)) & ~target_mask & ~(1 << start)
+        return target_mask, blocked_mask
 
-        queue = []
-        heappush(queue, (1, start, [start]))
-        min_len = max(0, minimum_length)
+    def _search_paths(self, start: int, target_mask: int, blocked_mask: int, min_hops: int, max_hops: int) -> list[int] | None:
+        """
+        Depth first search for the shortest simple path of min_hops to max_hops hops. Entries
+        are (index, visited mask, hops) with the path kept as parent pointers in nodes/parents.
+        Each path found leaves only shorter hop counts needed. A branch is dropped unless some
+        hop count still needed lies between its distance to a target and the number of cells
+        it can reach, both measured around the cells already visited.
+        """
+        needed = list(range(min_hops, max_hops + 1))
+        found = None
+        passable_mask = self.node_mask & ~blocked_mask & ~target_mask
+        # distance to a target ignoring visited cells, orders neighbors closest first
+        target_distance = self._distances_from(target_mask, passable_mask)
 
-        best_path = None
-        best_distance = 9999999
+        nodes = [start]
+        parents = [-1]
+        stack = [(0, 1 << start, 0)]
+        stack_peak = 1
+        while stack and needed:
+            entry, visited, hops = stack.pop()
+            node = nodes[entry]
+            if (target_mask >> node & 1):
+                if (hops in needed):
+                    path = []
+                    while entry >= 0:
+                        path.append(nodes[entry])
+                        entry = parents[entry]
+                    found = path[::-1]
+                    needed = [x for x in needed if x < hops]
+                continue
 
-        while queue:
-            distance, node, path = heappop(queue)
-            if node in targets and distance >= min_len and distance < best_distance:
-                best_path = path
-                best_distance = distance
-            if (distance >= best_distance):
+            # the distance ignoring visited cells is a cheaper lower bound, try it first
+            if (hops + target_distance.get(node, 9999999) > needed[-1]):
                 continue
-            if (any([end in path for end in targets])):
+            distance, reach = self._distance_and_reach(node, passable_mask & ~visited, target_mask)
+            if not any([distance <= length - hops <= reach for length in needed]):
                 continue
-            for neighbor in self.neighbors(node):
-                if (neighbor in path) or (neighbor in additional_excludes):
-                    continue
-                heappush(queue, (distance + 1, neighbor, path + [neighbor]))
-        return best_path
+            neighbors = list(mask_ids(self.neighbor_masks[node] & (passable_mask | target_mask) & ~visited))
+            neighbors.sort(key=lambda x: target_distance.get(x, 0), reverse=True)
+            for neighbor in neighbors:
+                nodes.append(neighbor)
+                parents.append(entry)
+                stack.append((len(nodes) - 1, visited | 1 << neighbor, hops + 1))
+            stack_peak = max(stack_peak, len(stack))
+        instrument.count_search(len(nodes), stack_peak)
+        return found
+
+    def _distance_and_reach(self, node: int, passable_mask: int, target_mask: int) -> tuple[int, int]:
+        """
+        Hops from node to the nearest target and the most hops a simple path from node can take,
+        moving through passable_mask and stepping onto a target last
+        """
+        # mask_ids inlined, this runs once per search expansion
+        neighbor_masks = self.neighbor_masks
+        seen = 1 << node
+        frontier = seen
+        level = 0
+        distance = 9999999
+        while frontier:
+            level += 1
+            reached = 0
+            remaining = frontier
+            while remaining:
+                low = remaining & -remaining
+                reached |= neighbor_masks[low.bit_length() - 1]
+                remaining ^= low
+            if (distance == 9999999 and reached & target_mask):
+                distance = level
+            frontier = reached & passable_mask & ~seen
+            seen |= frontier
+        if (distance == 9999999):
+            return distance, -1
+        return distance, seen.bit_count()
+
+    def flood(self, sources: int, passable_mask: int) -> int:
+        """
+        Mask of the sources, the passable cells connected to them and the cells bordering those
+        """
+        seen = sources
+        frontier = sources
+        while frontier:
+            reached = 0
+            for current in mask_ids(frontier):
+                reached |= self.neighbor_masks[current]
+            frontier = reached & ~seen
+            seen |= frontier
+            frontier &= passable_mask
+        return seen
 
+    def _distances_from(self, sources: int, passable_mask: int) -> dict[int, int]:
+        distances = {node: 0 for node in mask_ids(sources)}
+        seen = sources
+        frontier = sources
+        level = 0
+        while frontier:
+            level += 1
+            reached = 0
+            for current in mask_ids(frontier):
+                reached |= self.neighbor_masks[current]
+            frontier = reached & passable_mask & ~seen
+            seen |= frontier
+            for node in mask_ids(frontier):
+                distances[node] = level
+        return distances
+
+    @instrument.instrumented("split_contiguous_nodes")
     def split_contiguous_nodes(self, nodes: set[int]) -> list[set[int]]:
-        valid_nodes = {n for n in nodes if n in self.adj and n not in self.disabled_nodes}
+        valid_mask = self.nodes_to_mask(nodes) & ~self.disabled_mask
         components: list[set[int]] = []
-        visited: set[int] = set()
-        for node in valid_nodes:
-            if node in visited:
-                continue
-            component: set[int] = set()
-            stack = [node]
-            visited.add(node)
-            while stack:
-                current = stack.pop()
-                component.add(current)
-                for neighbor in self.neighbors(current):
-                    if neighbor in valid_nodes and neighbor not in visited:
-                        visited.add(neighbor)
-                        stack.append(neighbor)
-            components.append(component)
+        # every valid node is expanded once, the frontier is the queue
+        expanded = valid_mask.bit_count()
+        frontier_peak = 0
+        while valid_mask:
+            component = valid_mask & -valid_mask
+            frontier = component
+            while frontier:
+                frontier_peak = max(frontier_peak, frontier.bit_count())
+                reached = 0
+                for current in mask_ids(frontier):
+                    reached |= self.neighbor_masks[current]
+                frontier = reached & valid_mask & ~component
+                component |= frontier
+            valid_mask &= ~component
+            components.append(set(mask_ids(component)))
+        instrument.count_search(expanded, frontier_peak)
         return components
+
+# labels expanded per (cell, aspect) state in the passes of find_cheapest_connection
+CONNECTION_LABEL_LIMITS = [1, 2]
+
+@instrument.instrumented("find_cheapest_connection")
+def find_cheapest_connection(grid: HexGrid, aspect_rels: AspectRelations, placed_aspects: dict[int, str], starts: list[int], ends: list[int]) -> list[tuple[int, str]] | None:
+    """
+    Cheapest chain of (cell, aspect) from one of starts to one of ends, where consecutive cells
+    are hex neighbors holding related aspects and the new cells are free (not disabled or placed).
+    A* over (cell, aspect) states, one pass per limit in CONNECTION_LABEL_LIMITS until a pass
+    dropped no label that could have led to a cheaper chain.
+    Returns the whole chain including its start and the reached end.
+    """
+    target_mask = grid.nodes_to_mask(ends) & ~grid.disabled_mask
+    start_mask = grid.nodes_to_mask([x for x in starts if x in placed_aspects]) & ~grid.disabled_mask & ~target_mask
+    free_mask = grid.enabled_mask() & ~grid.nodes_to_mask(placed_aspects.keys())
+    # no grid path at all, don't run through every (cell, aspect) state to find out
+    if not grid.flood(start_mask, free_mask) & target_mask:
+        return None
+    aspect_ids = aspect_rels.aspect_ids
+    target_aspects = {node: aspect_ids[placed_aspects[node]] for node in mask_ids(target_mask)}
+    bounds = _connection_bounds(grid, aspect_rels, target_aspects, free_mask | start_mask)
+    start_aspects = {node: aspect_ids[placed_aspects[node]] for node in mask_ids(start_mask)}
+
+    for max_labels in CONNECTION_LABEL_LIMITS:
+        path, cost, dropped_bound = _search_connection(grid, aspect_rels, bounds, start_aspects, target_aspects, free_mask, max_labels)
+        if (dropped_bound >= cost):
+            break
+    if (path == None):
+        return None
+    return [(cell, aspect_rels.aspect_names[aspect]) for cell, aspect in path]
+
+def _dominated(labels: list[tuple[int, int]], cost: int, visited: int) -> bool:
+    # some label cost no more and used none of the cells left free by visited
+    for x_cost, x_visited in labels:
+        if (x_cost <= cost and not x_visited & ~visited):
+            return True
+    return False
+
+def _search_connection(grid: HexGrid, aspect_rels: AspectRelations, bounds: list[list[int]], start_aspects: dict[int, int], target_aspects: dict[int, int], free_mask: int, max_labels: int) -> tuple[list[tuple[int, int]] | None, int, int]:
+    """
+    One A* pass of find_cheapest_connection keeping up to max_labels labels per state, ordered
+    by cost plus bound. A label is dropped when an earlier one of its state cost no more and
+    used none of the cells it left free.
+    Returns the (cell, aspect id) chain or None, its cost (UNREACHABLE for None) and the
+    least bound of the labels dropped over the limit (UNREACHABLE if none were).
+    """
+    aspect_count = len(aspect_rels.aspect_names)
+    costs = aspect_rels.cost_array.tolist()
+    offsets = aspect_rels.adj_offsets.tolist()
+    targets = aspect_rels.adj_targets.tolist()
+    related = [targets[offsets[i]:offsets[i + 1]] for i in range(aspect_count)]
+    target_mask = grid.nodes_to_mask(target_aspects.keys())
+
+    label_cells = list(start_aspects.keys())
+    label_aspects = list(start_aspects.values())
+    label_parents = [-1] * len(label_cells)
+    # cells on the path of each expanded label, a queued label has its parent's plus its own
+    label_visited : list[int] = [0] * len(label_cells)
+    queue = [(bounds[x][label_aspects[i]], i, 0) for i, x in enumerate(label_cells)]
+    # (cost, visited cells) of the labels expanded per state
+    expanded : dict[int, list[tuple[int, int]]] = {}
+    expansions = 0
+    dropped_bound = UNREACHABLE
+    queue_peak = len(queue)
+    path = None
+    path_cost = UNREACHABLE
+    while queue:
+        bound, label, cost = heappop(queue)
+        cell = label_cells[label]
+        aspect = label_aspects[label]
+        parent = label_parents[label]
+        visited = (0 if parent < 0 else label_visited[parent]) | 1 << cell
+        if (target_mask >> cell & 1):
+            path = []
+            while label >= 0:
+                path.append((label_cells[label], label_aspects[label]))
+                label = label_parents[label]
+            path.reverse()
+            path_cost = cost
+            break
+        state_labels = expanded.setdefault(cell * aspect_count + aspect, [])
+        if (len(state_labels) >= max_labels):
+            # only a label that isn't dominated lowers dropped_bound, and only checked when it would
+            if (bound < dropped_bound and not _dominated(state_labels, cost, visited)):
+                dropped_bound = bound
+            continue
+        if (_dominated(state_labels, cost, visited)):
+            continue
+        state_labels.append((cost, visited))
+        label_visited[label] = visited
+        expansions += 1
+
+        for neighbor in mask_ids(grid.neighbor_masks[cell] & ~visited):
+            if (target_mask >> neighbor & 1):
+                if (target_aspects[neighbor] in related[aspect]):
+                    label_cells.append(neighbor)
+                    label_aspects.append(target_aspects[neighbor])
+                    label_parents.append(label)
+                    label_visited.append(0)
+                    heappush(queue, (cost, len(label_cells) - 1, cost))
+            elif (free_mask >> neighbor & 1):
+                neighbor_bounds = bounds[neighbor]
+                for next_aspect in related[aspect]:
+                    bound = neighbor_bounds[next_aspect]
+                    if (bound >= UNREACHABLE):
+                        continue
+                    next_cost = cost + costs[next_aspect]
+                    # the label would be dropped once popped, skip the heap
+                    next_labels = expanded.get(neighbor * aspect_count + next_aspect, ())
+                    if (len(next_labels) >= max_labels):
+                        if (next_cost + bound < dropped_bound and not _dominated(next_labels, next_cost, visited | 1 << neighbor)):
+                            dropped_bound = next_cost + bound
+                        continue
+                    label_cells.append(neighbor)
+                    label_aspects.append(next_aspect)
+                    label_parents.append(label)
+                    label_visited.append(0)
+                    heappush(queue, (next_cost + bound, len(label_cells) - 1, next_cost))
+        queue_peak = max(queue_peak, len(queue))
+    instrument.count_search(expansions, queue_peak)
+    return path, path_cost, dropped_bound
+
+def _grid_chain_lower_bounds(grid: HexGrid, aspect_rels: AspectRelations) -> np.ndarray:
+    # rows up to the grid diameter, beyond the table the bounds of far apart cells would flatten out
+    aspect_rels._extend_chain_table(2 * grid.radius)
+    return aspect_rels.chain_lower_bounds
+
+def _connection_bounds(grid: HexGrid, aspect_rels: AspectRelations, target_aspects: dict[int, int], passable_mask: int) -> list[list[int]]:
+    """
+    bounds[cell][aspect] is a lower bound on the cost of the aspects still needed between the
+    cell holding the aspect and any target, UNREACHABLE when the cell cannot reach one.
+    A target d cells away needs a chain of at least d hops, see chain_lower_bounds.
+    """
+    chain_lower_bounds = _grid_chain_lower_bounds(grid, aspect_rels)
+    max_length = len(chain_lower_bounds) - 1
+    bounds = np.full((len(grid.id_to_coord), len(aspect_rels.aspect_names)), UNREACHABLE, dtype=np.int32)
+    by_aspect : dict[int, list[int]] = {}
+    for node, aspect in target_aspects.items():
+        by_aspect.setdefault(aspect, []).append(node)
+    for aspect, nodes in by_aspect.items():
+        # rows indexed by the grid distance
+        at_least = chain_lower_bounds[:, :, aspect]
+        distances = grid._distances_from(grid.nodes_to_mask(nodes), passable_mask)
+        cells = np.fromiter(distances.keys(), dtype=np.int64, count=len(distances))
+        rows = np.minimum(np.fromiter(distances.values(), dtype=np.int64, count=len(distances)), max_length)
+        bounds[cells] = np.minimum(bounds[cells], at_least[rows])
+    return bounds.tolist()
+
+def _pair_lower_bounds(grid: HexGrid, aspect_rels: AspectRelations, placed_aspects: dict[int, str], starts: list[int], ends: list[int]) -> np.ndarray:
+    # bounds[i, j] from the grid distance and chain lower bound of starts[i] and ends[j], all enabled
+    aspect_ids = aspect_rels.aspect_ids
+    chain_lower_bounds = _grid_chain_lower_bounds(grid, aspect_rels)
+    distances = grid.distances[np.ix_(starts, ends)]
+    lengths = np.minimum(distances, len(chain_lower_bounds) - 1)
+    start_aspects = np.array([aspect_ids[placed_aspects[x]] for x in starts])
+    end_aspects = np.array([aspect_ids[placed_aspects[x]] for x in ends])
+    bounds = chain_lower_bounds[lengths, start_aspects[:, None], end_aspects[None, :]]
+    bounds[distances >= UNREACHABLE] = UNREACHABLE
+    return bounds
+
+def set_lower_bounds(grid: HexGrid, aspect_rels: AspectRelations, placed_aspects: dict[int, str], sets: list[set[int]]) -> np.ndarray:
+    """
+    bounds[i, j] is the least cost any connection from sets[i] to sets[j] can have, from the
+    grid distances and chain lower bounds of every pair of their enabled cells, UNREACHABLE
+    when no pair can be connected. Placed aspects in the way are ignored, so it only ever
+    underestimates. One lookup over all pairs of placed cells, reduced to the sets they
+    belong to. The diagonal is UNREACHABLE.
+    """
+    bounds = np.full((len(sets), len(sets)), UNREACHABLE, dtype=np.int32)
+    nodes = [x for nodes in sets for x in nodes if not grid.is_disabled(x)]
+    if (not nodes):
+        return bounds
+    labels = np.array([i for i, nodes in enumerate(sets) for x in nodes if not grid.is_disabled(x)])
+    pair_bounds = _pair_lower_bounds(grid, aspect_rels, placed_aspects, nodes, nodes)
+    np.minimum.at(bounds, (labels[:, None], labels[None, :]), pair_bounds)
+    bounds[np.arange(len(sets)), np.arange(len(sets))] = UNREACHABLE
+    return bounds
+
+class SteinerConnection:
+    """
+    Exact minimum cost connection of every placed aspect, a node weighted Steiner tree over
+    (cell, aspect) states. States are joined when the cells are hex neighbors and the aspects
+    are related, a state costs its aspect cost unless the cell already holds that aspect.
+
+    dp[terminal subset][state] is the cheapest tree connecting the subset that contains state,
+    built by merging two subsets at a state and relaxing along state edges until stable.
+    The tree may use one cell with two aspects, so trees with such a conflict are split in a
+    best first branch and bound that restricts the cell's aspects, dp being the bound.
+
+    The table grows with 2^terminals * cells * aspects, so terminals are capped at MAX_TERMINALS
+    and the table at MAX_STATES entries, larger boards are left to the greedy search.
+    """
+    MAX_TERMINALS = 10
+    MAX_STATES = 1 << 24
+
+    def __init__(self, grid: HexGrid, aspect_rels: AspectRelations, placed_aspects: dict[int, str], time_limit: float = 10.0, cancel = None):
+        self.grid = grid
+        self.aspect_rels = aspect_rels
+        self.placed_aspects = placed_aspects
+        self.deadline = time.perf_counter() + time_limit
+        # optional threading.Event, setting it stops the solve like running out of time
+        self.cancel = cancel
+
+        self.cell_count = len(grid.id_to_coord)
+        self.aspect_count = len(aspect_rels.aspect_names)
+        # hex neighbors per cell, padded with cell_count which indexes an UNREACHABLE row
+        self.hex_neighbors = np.full((self.cell_count, 6), self.cell_count, dtype=np.int64)
+        for node, neighbors in grid.adj.items():
+            self.hex_neighbors[node, :len(neighbors)] = neighbors
+        self.adj_targets = aspect_rels.adj_targets.astype(np.int64)
+        self.adj_starts = aspect_rels.adj_offsets[:-1]
+
+        self.weights = np.tile(aspect_rels.cost_array.astype(np.int64), (self.cell_count, 1))
+        for node in mask_ids(grid.disabled_mask):
+            self.weights[node] = UNREACHABLE
+        for node, aspect in placed_aspects.items():
+            self.weights[node] = UNREACHABLE
+            self.weights[node, aspect_rels.aspect_ids[aspect]] = 0
+        self.terminals = grid.split_contiguous_nodes(placed_aspects.keys())
+
+    def solve(self) -> dict[int, str] | None:
+        """
+        Returns the aspects to add, or None when the board can't be connected, has too
+        many terminals or the time limit runs out
+        """
+        if len(self.terminals) <= 1:
+            return {}
+        if len(self.terminals) > self.MAX_TERMINALS:
+            return None
+        if (1 << len(self.terminals)) * self.cell_count * self.aspect_count > self.MAX_STATES:
+            return None
+
+        counter = 0
+        queue = []
+        heappush(queue, (0, counter, np.zeros_like(self.weights, dtype=bool), None))
+        while queue:
+            bound, _, forbidden, states = heappop(queue)
+            if states is None:
+                result = self._solve_restricted(forbidden)
+                if result is None:
+                    continue
+                cost, states = result
+                counter += 1
+                heappush(queue, (cost, counter, forbidden, states))
+                continue
+
+            aspects_by_cell : dict[int, list[int]] = {}
+            for state in states:
+                aspects_by_cell.setdefault(state // self.aspect_count, []).append(state % self.aspect_count)
+            conflicts = [(cell, aspects) for cell, aspects in aspects_by_cell.items() if len(aspects) > 1]
+            if not conflicts:
+                return {cell: self.aspect_rels.aspect_names[aspects[0]] for cell, aspects in aspects_by_cell.items() if cell not in self.placed_aspects}
+
+            # a valid tree holds one of the conflicting aspects in the cell, or none of them
+            cell, aspects = conflicts[0]
+            for keep in aspects + [None]:
+                child = forbidden.copy()
+                child[cell, aspects] = True
+                if keep is not None:
+                    child[cell] = True
+                    child[cell, keep] = False
+                counter += 1
+                heappush(queue, (bound, counter, child, None))
+        return None
+
+    def _solve_restricted(self, forbidden: np.ndarray) -> tuple[int, set[int]] | None:
+        weights = np.where(forbidden, UNREACHABLE, self.weights)
+        shape = weights.shape
+        full = (1 << len(self.terminals)) - 1
+        dp = np.full((full + 1,) + shape, UNREACHABLE, dtype=np.int64)
+        # pred: flat state the value was relaxed from, merge: subset it was merged from
+        pred = np.full((full + 1,) + shape, -1, dtype=np.int32)
+        merge = np.zeros((full + 1,) + shape, dtype=np.uint16)
+        for i, terminal in enumerate(self.terminals):
+            for node in terminal:
+                dp[1 << i, node, self.aspect_rels.aspect_ids[self.placed_aspects[node]]] = 0
+
+        for mask in range(1, full + 1):
+            if time.perf_counter() > self.deadline or (self.cancel != None and self.cancel.is_set()):
+                return None
+            low = mask & -mask
+            if mask != low:
+                sub = (mask - 1) & mask
+                while sub:
+                    if sub & low:
+                        merged = dp[sub] + dp[mask ^ sub] - weights
+                        better = merged < dp[mask]
+                        dp[mask][better] = merged[better]
+                        merge[mask][better] = sub
+                    sub = (sub - 1) & mask
+            self._relax(dp[mask], pred[mask], merge[mask], weights)
+
+        best = int(np.argmin(dp[full]))
+        if dp[full].flat[best] >= UNREACHABLE:
+            return None
+        states : set[int] = set()
+        visited : set[tuple[int, int]] = set()
+        stack = [(full, best)]
+        while stack:
+            mask, state = stack.pop()
+            if (mask, state) in visited:
+                continue
+            visited.add((mask, state))
+            states.add(state)
+            sub = int(merge[mask].flat[state])
+            if sub:
+                stack.append((sub, state))
+                stack.append((mask ^ sub, state))
+            elif pred[mask].flat[state] >= 0:
+                stack.append((mask, int(pred[mask].flat[state])))
+        return int(dp[full].flat[best]), states
+
+    def _relax(self, values: np.ndarray, pred: np.ndarray, merge: np.ndarray, weights: np.ndarray):
+        padded = np.concatenate([values, np.full((1, self.aspect_count), UNREACHABLE, dtype=np.int64)])
+        width = len(self.adj_targets)
+        while True:
+            # cheapest hex neighbor per aspect, direction kept in the low 3 bits
+            encoded = (padded[self.hex_neighbors] << 3) + np.arange(6)[None, :, None]
+            nearest = encoded.min(axis=1)
+            # cheapest related aspect, CSR position kept as the remainder
+            encoded = (nearest[:, self.adj_targets] >> 3) * width + np.arange(width)
+            related = np.minimum.reduceat(encoded, self.adj_starts, axis=1)
+            source_aspect = self.adj_targets[related % width]
+            direction = np.take_along_axis(nearest, source_aspect, axis=1) & 7
+            source_cell = np.take_along_axis(self.hex_neighbors, direction, axis=1)
+
+            candidate = related // width + weights
+            better = candidate < values
+            if not better.any():
+                return
+            values[better] = candidate[better]
+            padded[:-1][better] = candidate[better]
+            pred[better] = (source_cell * self.aspect_count + source_aspect)[better]
+            merge[better] = 0
@@ -0,0 +1,95 @@
+"""
+Packs templates/*.png and hex.png into one texture atlas with a UV table
+
+    python atlas.py            build the atlas into .atlas_cache/ if a source changed
+
+The app calls load_atlas() on startup, which does the same and reads the cached atlas
+when the sources are unchanged. Running the build ahead of time only spares the first
+start the packing.
+"""
+import hashlib
+import json
+from pathlib import Path
+from PIL import Image
+
+ATLAS_DIR = Path(__file__).parent
+CACHE_DIR = ATLAS_DIR / ".atlas_cache"
+# transparent gap around every image, so linear filtering never samples a neighbor
+PADDING = 1
+
+def source_images() -> dict[str, Path]:
+    # aspects by name, plus the grid cell background as "hex"
+    sources = {path.stem: path for path in sorted((ATLAS_DIR / "templates").glob("*.png"))}
+    sources["hex"] = ATLAS_DIR / "hex.png"
+    return sources
+
+def source_hash(sources: dict[str, Path]) -> str:
+    digest = hashlib.sha256()
+    for name, path in sorted(sources.items()):
+        digest.update(name.encode("utf-8") + b"\0")
+        digest.update(path.read_bytes())
+    digest.update(f"padding {PADDING}".encode("utf-8"))
+    return digest.hexdigest()[:16]
+
+def build_atlas(sources: dict[str, Path]) -> tuple[Image.Image, dict[str, tuple[int, int, int, int]]]:
+    """
+    Shelf packs the images, tallest first, into rows about as wide as the atlas is tall.
+    Returns the RGBA atlas and each image's pixel rect (x, y, width, height).
+    """
+    images = {}
+    for name, path in sources.items():
+        with Image.open(path) as img:
+            images[name] = img.convert("RGBA")
+    order = sorted(images, key=lambda name: (-images[name].height, name))
+    area = sum([(img.width + 2 * PADDING) * (img.height + 2 * PADDING) for img in images.values()])
+    row_width = max(max([img.width + 2 * PADDING for img in images.values()]), int(area ** 0.5))
+
+    rects : dict[str, tuple[int, int, int, int]] = {}
+    x = y = row_height = width = 0
+    for name in order:
+        img = images[name]
+        if (x + img.width + 2 * PADDING > row_width):
+            x = 0
+            y += row_height
+            row_height = 0
+        rects[name] = (x + PADDING, y + PADDING, img.width, img.height)
+        x += img.width + 2 * PADDING
+        width = max(width, x)
+        row_height = max(row_height, img.height + 2 * PADDING)
+
+    atlas = Image.new("RGBA", (width, y + row_height), (0, 0, 0, 0))
+    for name, (x, y, _, _) in rects.items():
+        atlas.paste(images[name], (x, y))
+    return atlas, rects
+
+def load_atlas(cache_dir: Path = CACHE_DIR) -> tuple[Image.Image, dict[str, tuple[tuple[float, float], tuple[float, float]]]]:
+    """
+    Returns the atlas and the (uv0, uv1) corners of every image in it, building and caching
+    the atlas under cache_dir when no atlas for the current sources is there yet.
+    """
+    sources = source_images()
+    key = source_hash(sources)
+    image_path = cache_dir / f"atlas-{key}.png"
+    rects_path = cache_dir / f"atlas-{key}.json"
+    if (image_path.exists() and rects_path.exists()):
+        with open(rects_path) as f:
+            rects = {name: tuple(rect) for name, rect in json.load(f).items()}
+        with Image.open(image_path) as img:
+            atlas = img.convert("RGBA")
+    else:
+        atlas, rects = build_atlas(sources)
+        cache_dir.mkdir(exist_ok=True)
+        for stale in cache_dir.glob("atlas-*"):
+            stale.unlink()
+        atlas.save(image_path)
+        with open(rects_path, "w") as f:
+            json.dump(rects, f)
+
+    uvs = {}
+    for name, (x, y, w, h) in rects.items():
+        uvs[name] = ((x / atlas.width, y / atlas.height), ((x + w) / atlas.width, (y + h) / atlas.height))
+    return atlas, uvs
+
+if __name__ == "__main__":
+    atlas, uvs = load_atlas()
+    print(f"{len(uvs)} images in a {atlas.width}x{atlas.height} atlas")
@@ -0,0 +1,239 @@
+"""
+Benchmarks the solver hot paths on a generated board corpus (see puzzles.py)
+
+    python bench.py                                   print a report
+    python bench.py --save-baseline bench_baseline.json
+    python bench.py --baseline bench_baseline.json    exit 1 on regressions
+    python bench.py --scaling --sizes 5 10 15 20       growth of solve time with the grid size
+
+Per grid size it reports latency percentiles of find_path_exact_length, find_path_minimum_length,
+split_contiguous_nodes and a full solve, the mean solution cost and the success rate. Each board
+runs in a worker process that is killed after --timeout seconds, a board that times out counts
+as a failed solve. The peak traced memory of a solve is measured afterwards in its own run, as
+tracing slows the solve down several times, with --memory-timeout seconds per board. A board
+that runs out of that budget has no memory figure but still counts as solved.
+"""
+import argparse
+import json
+import multiprocessing
+import random
+import sys
+import time
+import tracemalloc
+import numpy as np
+from algo import AspectRelations, ChainSearchExhausted
+from puzzles import generate_corpus
+from solver import SolverMode, board_from_json, is_connected, solution_cost, solve
+
+OPERATIONS = ["find_path_exact_length", "find_path_minimum_length", "split_contiguous_nodes", "solve"]
+# solve() no longer asks for chains by length, and past about 10 hops the cheapest chains loop, so the
+# queries only measure the budgeted fallback search of find_chain_ids, exhausted ones included
+MAX_CHAIN_LENGTH = 10
+
+_worker_aspect_rels : AspectRelations | None = None
+
+def _init_worker():
+    global _worker_aspect_rels
+    _worker_aspect_rels = AspectRelations()
+
+def measure_board(board: dict, solver_mode: SolverMode, seed: int) -> dict:
+    aspect_rels = _worker_aspect_rels
+    grid, placed_aspects = board_from_json(board, aspect_rels)
+    grid_size = board["grid_size"]
+    timings : dict[str, list[float]] = {op: [] for op in OPERATIONS}
+
+    for _ in range(10):
+        start_time = time.perf_counter()
+        grid.split_contiguous_nodes(placed_aspects.keys())
+        timings["split_contiguous_nodes"].append(time.perf_counter() - start_time)
+
+    # chains between every ordered pair of placed aspects, the way solve() used to ask for them
+    for start in placed_aspects.values():
+        for end in placed_aspects.values():
+            for length in range(1, min(grid_size, MAX_CHAIN_LENGTH) + 1):
+                start_time = time.perf_counter()
+                try:
+                    aspect_rels.find_path_exact_length(start, end, length)
+                except ChainSearchExhausted:
+                    pass
+                timings["find_path_exact_length"].append(time.perf_counter() - start_time)
+
+    for node in placed_aspects:
+        others = [x for x in placed_aspects if x != node]
+        for minimum_length in range(4):
+            start_time = time.perf_counter()
+            grid.find_path_minimum_length(node, others, minimum_length, list(placed_aspects.keys()))
+            timings["find_path_minimum_length"].append(time.perf_counter() - start_time)
+
+    start_time = time.perf_counter()
+    solved_aspects = solve(grid, aspect_rels, placed_aspects, solver_mode, rng=random.Random(seed))
+    timings["solve"].append(time.perf_counter() - start_time)
+
+    return {
+        "timings": timings,
+        "complete": is_connected(grid, solved_aspects),
+        "cost": solution_cost(aspect_rels, placed_aspects, solved_aspects),
+        "peak_memory": None,
+    }
+
+def measure_memory(board: dict, solver_mode: SolverMode, seed: int) -> int:
+    # the same solve as measure_board under tracemalloc, in a fresh grid so nothing built there is reused
+    grid, placed_aspects = board_from_json(board, _worker_aspect_rels)
+    tracemalloc.start()
+    try:
+        solve(grid, _worker_aspect_rels, placed_aspects, solver_mode, rng=random.Random(seed))
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+def _apply(pool: multiprocessing.Pool, func, args: tuple, timeout: float):
+    """
+    Runs func in the pool, returns the pool to use next and the result, None on timeout
+    """
+    try:
+        return pool, pool.apply_async(func, args).get(timeout)
+    except multiprocessing.TimeoutError:
+        pool.terminate()
+        return multiprocessing.Pool(1, initializer=_init_worker), None
+
+def run(boards: list[dict], solver_mode: SolverMode, seed: int, timeout: float, memory_timeout: float) -> dict:
+    by_size : dict[int, list[tuple[str, dict | None]]] = {}
+    pool = multiprocessing.Pool(1, initializer=_init_worker)
+    try:
+        for board in boards:
+            pool, measurement = _apply(pool, measure_board, (board, solver_mode, seed), timeout)
+            if (measurement != None and memory_timeout > 0):
+                pool, measurement["peak_memory"] = _apply(pool, measure_memory, (board, solver_mode, seed), memory_timeout)
+            by_size.setdefault(board["grid_size"], []).append((board["id"], measurement))
+            status = "timeout" if measurement == None else "ok" if measurement["peak_memory"] != None else "ok, no memory figure"
+            print(f"{board['id']}: {status}", file=sys.stderr, flush=True)
+    finally:
+        pool.terminate()
+
+    report = {}
+    for grid_size, results in sorted(by_size.items()):
+        measurements = [m for _, m in results]
+        finished = [m for m in measurements if m != None]
+        solved = [m for m in finished if m["complete"]]
+        ops = {}
+        for op in OPERATIONS:
+            samples = np.array([t for m in finished for t in m["timings"][op]]) * 1000
+            if (len(samples) == 0):
+                continue
+            p50, p90, p99 = np.percentile(samples, [50, 90, 99])
+            ops[op] = {"calls": len(samples), "p50_ms": p50, "p90_ms": p90, "p99_ms": p99, "max_ms": samples.max()}
+        report[str(grid_size)] = {
+            "boards": len(measurements),
+            "timeouts": len(measurements) - len(finished),
+            "success_rate": len(solved) / len(measurements),
+            "mean_cost": float(np.mean([m["cost"] for m in solved])) if solved else None,
+            "peak_memory_kb": max([m["peak_memory"] for m in finished if m["peak_memory"] != None], default=0) / 1024,
+            "memory_timeouts": len([m for m in finished if m["peak_memory"] == None]),
+            # per board cost of complete solutions, None for failed or timed out boards
+            "costs": {board_id: m["cost"] if m != None and m["complete"] else None for board_id, m in results},
+            "operations": ops,
+        }
+    return report
+
+def find_regressions(report: dict, baseline: dict, threshold: float) -> list[str]:
+    """
+    Boards solved in the baseline must still be solved and their total cost may grow by
+    threshold. Latency percentiles may grow by threshold (plus 0.05ms of timer noise), they
+    are only compared for sizes without baseline timeouts, as those only cover the easy boards.
+    """
+    regressions = []
+    for grid_size, base in baseline.items():
+        current = report.get(grid_size)
+        if (current == None):
+            continue
+        solved = [b for b, cost in base["costs"].items() if cost != None]
+        lost = [b for b in solved if current["costs"].get(b) == None]
+        if (lost):
+            regressions.append(f"size {grid_size}: no longer solved {', '.join(lost)}")
+        kept = [b for b in solved if b not in lost]
+        base_cost = sum([base["costs"][b] for b in kept])
+        cost = sum([current["costs"][b] for b in kept])
+        if (cost > base_cost * (1 + threshold)):
+            regressions.append(f"size {grid_size}: total cost {cost} > {base_cost}")
+        if (base["timeouts"] != 0):
+            continue
+        for op, base_stats in base["operations"].items():
+            stats = current["operations"].get(op)
+            if (stats == None):
+                continue
+            for key in ["p50_ms", "p90_ms"]:
+                if (stats[key] > base_stats[key] * (1 + threshold) + 0.05):
+                    regressions.append(f"size {grid_size}: {op} {key} {stats[key]:.3f} > {base_stats[key]:.3f}")
+    return regressions
+
+def print_report(report: dict):
+    for grid_size, size_report in report.items():
+        mean_cost = "-" if size_report["mean_cost"] == None else f"{size_report['mean_cost']:.1f}"
+        untraced = "" if size_report["memory_timeouts"] == 0 else f" ({size_report['memory_timeouts']} boards untraced)"
+        print(f"size {grid_size}: {size_report['boards']} boards, {size_report['timeouts']} timeouts, "
+              f"success {size_report['success_rate']:.0%}, mean cost {mean_cost}, peak {size_report['peak_memory_kb']:.0f}KB{untraced}")
+        for op, stats in size_report["operations"].items():
+            print(f"    {op:26} n={stats['calls']:<6} p50 {stats['p50_ms']:9.3f}ms  p90 {stats['p90_ms']:9.3f}ms  "
+                  f"p99 {stats['p99_ms']:9.3f}ms  max {stats['max_ms']:9.3f}ms")
+
+def scaling(report: dict) -> tuple[list[tuple[int, int, float]], float]:
+    """
+    (grid size, cells, solve p50 ms) per size and the exponent k of the least squares fit
+    p50 ~ cells^k. Polynomial growth keeps k and the exponents between neighboring sizes
+    bounded, exponential growth in the radius makes them climb with the size.
+    """
+    rows = []
+    for grid_size, size_report in report.items():
+        solve_stats = size_report["operations"].get("solve")
+        if (solve_stats != None):
+            radius = int(grid_size) - 1
+            rows.append((int(grid_size), 3 * radius * (radius + 1) + 1, solve_stats["p50_ms"]))
+    if (len(rows) < 2):
+        return rows, float("nan")
+    cells = np.log([cell_count for _, cell_count, _ in rows])
+    times = np.log([p50 for _, _, p50 in rows])
+    return rows, float(np.polyfit(cells, times, 1)[0])
+
+def print_scaling(report: dict):
+    rows, exponent = scaling(report)
+    previous = None
+    for grid_size, cell_count, p50 in rows:
+        local = "" if previous == None else f", local exponent {np.log(p50 / previous[1]) / np.log(cell_count / previous[0]):.2f}"
+        print(f"size {grid_size:3}: {cell_count:5} cells, solve p50 {p50:9.3f}ms, peak {report[str(grid_size)]['peak_memory_kb']:.0f}KB{local}")
+        previous = (cell_count, p50)
+    print(f"solve p50 ~ cells^{exponent:.2f}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the solver on generated boards")
+    parser.add_argument("--seed", type=int, default=1, help="corpus and solver seed")
+    parser.add_argument("--count", type=int, default=5, help="boards per grid size")
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(range(2, 11)))
+    # multi start runs its seeds in a process pool, which the daemonic board workers can't start
+    parser.add_argument("--mode", default="slow", choices=[m.name.lower() for m in SolverMode if m != SolverMode.MULTI_START])
+    parser.add_argument("--timeout", type=float, default=20, help="seconds per board")
+    parser.add_argument("--memory-timeout", type=float, default=60, help="seconds per board for the traced solve, 0 skips it")
+    parser.add_argument("--save-baseline", metavar="PATH")
+    parser.add_argument("--baseline", metavar="PATH", help="compare against a saved baseline")
+    parser.add_argument("--threshold", type=float, default=0.25, help="allowed relative regression")
+    parser.add_argument("--scaling", action="store_true", help="also fit how solve time grows with the cell count")
+    args = parser.parse_args()
+
+    boards = generate_corpus(args.seed, args.count, args.sizes, AspectRelations())
+    report = run(boards, SolverMode[args.mode.upper()], args.seed, args.timeout, args.memory_timeout)
+    print_report(report)
+    if (args.scaling):
+        print_scaling(report)
+
+    if (args.save_baseline):
+        with open(args.save_baseline, "w") as f:
+            json.dump(report, f, indent=2)
+    if (args.baseline):
+        with open(args.baseline) as f:
+            regressions = find_regressions(report, json.load(f), args.threshold)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if (regressions):
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
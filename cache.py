@@ -0,0 +1,95 @@
+"""
+Memoized solve() results, keyed by a canonical board fingerprint
+"""
+import json
+from collections import OrderedDict
+from pathlib import Path
+from algo import HexGrid
+from solver import SolverMode
+
+def _transform(index: int, coord: tuple[int, int]) -> tuple[int, int]:
+    # one of the 12 hex symmetries in axial coordinates: mirrored for index >= 6, then rotated by index % 6 * 60 degrees
+    q, r = coord
+    if (index >= 6):
+        q, r = r, q
+    for _ in range(index % 6):
+        q, r = -r, q + r
+    return (q, r)
+
+def _inverse_transform(index: int, coord: tuple[int, int]) -> tuple[int, int]:
+    q, r = coord
+    for _ in range((6 - index % 6) % 6):
+        q, r = -r, q + r
+    if (index >= 6):
+        q, r = r, q
+    return (q, r)
+
+def board_key(grid: HexGrid, placed_aspects: dict[int, str], solver_mode: SolverMode) -> tuple[str, int]:
+    """
+    Fingerprint of the radius, disabled cells, placed aspects and solver mode that is equal for
+    boards which are rotations or mirror images of each other. Returns it with the symmetry that
+    maps the board onto the canonical one (the smallest fingerprint of all 12).
+    """
+    candidates = []
+    for index in range(12):
+        disabled = sorted([_transform(index, grid.id_to_coord[node]) for node in grid.disabled_nodes])
+        placed = sorted([(*_transform(index, grid.id_to_coord[node]), aspect) for node, aspect in placed_aspects.items()])
+        candidates.append((json.dumps([grid.radius, solver_mode.name, disabled, placed]), index))
+    return min(candidates)
+
+class SolutionCache:
+    """
+    LRU cache of complete solutions. Entries hold the added aspects in the coordinates of the
+    canonical board, so a hit on a rotated or mirrored board is mapped back onto it.
+    With a path, entries are loaded from it on creation and written back by save().
+    """
+    def __init__(self, max_entries: int = 256, path: str | Path | None = None):
+        self.max_entries = max_entries
+        self.path = None if path == None else Path(path)
+        self.entries : OrderedDict[str, list[list]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        if (self.path != None and self.path.exists()):
+            try:
+                with open(self.path) as f:
+                    self.entries.update(json.load(f))
+            except (OSError, ValueError):
+                # a broken cache file only costs the old entries
+                self.entries.clear()
+            while (len(self.entries) > self.max_entries):
+                self.entries.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def get(self, grid: HexGrid, placed_aspects: dict[int, str], solver_mode: SolverMode) -> dict[int, str] | None:
+        key, index = board_key(grid, placed_aspects, solver_mode)
+        added = self.entries.get(key)
+        if (added == None):
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries.move_to_end(key)
+        solved_aspects = dict(placed_aspects)
+        for q, r, aspect in added:
+            solved_aspects[grid.coord_to_id[_inverse_transform(index, (q, r))]] = aspect
+        return solved_aspects
+
+    def put(self, grid: HexGrid, placed_aspects: dict[int, str], solver_mode: SolverMode, solved_aspects: dict[int, str]):
+        key, index = board_key(grid, placed_aspects, solver_mode)
+        added = [[*_transform(index, grid.id_to_coord[node]), aspect] for node, aspect in solved_aspects.items() if placed_aspects.get(node) != aspect]
+        self.entries[key] = added
+        self.entries.move_to_end(key)
+        while (len(self.entries) > self.max_entries):
+            self.entries.popitem(last=False)
+
+    def clear(self):
+        self.entries.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def save(self):
+        if (self.path == None):
+            return
+        with open(self.path, "w") as f:
+            json.dump(self.entries, f)
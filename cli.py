@@ -0,0 +1,80 @@
+"""
+Headless batch solver, reads one board per line of JSONL and writes one result per line
+
+    python cli.py boards.jsonl -o solutions.jsonl --mode slow
+
+Input lines look like
+    {"id": "b1", "grid_size": 4, "disabled": [[0, 1]], "placed": [[-3, 0, "ignis"], [3, 0, "aqua"]]}
+with axial (q, r) coordinates, "mode", "seed" and "deadline_ms" may override the command line per board.
+Output lines carry the board id, complete, cost, the added [q, r, aspect] cells and seconds,
+or an error message. Results are flushed as each board finishes. --stats adds the
+instrumentation report of each solve (see instrument.py), --profile PATH dumps a cProfile
+of the whole run.
+"""
+import argparse
+import contextlib
+import cProfile
+import json
+import random
+import sys
+import time
+import instrument
+from algo import AspectRelations
+from solver import DEFAULT_DEADLINE_MS, SolverMode, board_from_json, solution_to_json, solve
+
+def solve_line(line: str, aspect_rels: AspectRelations, solver_mode: SolverMode, seed: int | None, deadline_ms: float = DEFAULT_DEADLINE_MS, stats: bool = False) -> dict:
+    result = {"id": None}
+    try:
+        board = json.loads(line)
+        result["id"] = board.get("id")
+        grid, placed_aspects = board_from_json(board, aspect_rels)
+        mode = SolverMode[board["mode"].upper()] if "mode" in board else solver_mode
+        board_seed = board.get("seed", seed)
+        rng = None if board_seed == None else random.Random(board_seed)
+        start_time = time.perf_counter()
+        with (instrument.collect() if stats else contextlib.nullcontext()) as instrumentation:
+            solved_aspects = solve(grid, aspect_rels, placed_aspects, mode, rng=rng, deadline_ms=board.get("deadline_ms", deadline_ms))
+        result.update(solution_to_json(grid, aspect_rels, placed_aspects, solved_aspects))
+        result["seconds"] = time.perf_counter() - start_time
+        if (instrumentation != None):
+            result["stats"] = instrumentation.report()
+    except (KeyError, ValueError, TypeError, AttributeError) as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+    return result
+
+def main(argv: list[str] | None = None):
+    parser = argparse.ArgumentParser(description="Solve Thaumcraft research boards from JSONL")
+    parser.add_argument("input", nargs="?", default="-", help="JSONL boards, - for stdin")
+    parser.add_argument("-o", "--output", default="-", help="JSONL results, - for stdout")
+    parser.add_argument("--mode", default="slow", choices=[m.name.lower() for m in SolverMode])
+    parser.add_argument("--seed", type=int, default=None, help="seed for the greedy modes")
+    parser.add_argument("--addon", action="append", default=[], metavar="PATH", help="extra aspect pack in the aspects.json format, may repeat")
+    parser.add_argument("--stats", action="store_true", help="add instrumentation counters to each result")
+    parser.add_argument("--profile", metavar="PATH", help="write a cProfile dump of the whole run")
+    parser.add_argument("--deadline-ms", type=float, default=DEFAULT_DEADLINE_MS, help="time budget of the anytime mode")
+    args = parser.parse_args(argv)
+
+    aspect_rels = AspectRelations(addon_files=args.addon)
+    solver_mode = SolverMode[args.mode.upper()]
+    infile = sys.stdin if args.input == "-" else open(args.input)
+    outfile = sys.stdout if args.output == "-" else open(args.output, "w")
+    profiler = cProfile.Profile() if args.profile else None
+    try:
+        if (profiler != None):
+            profiler.enable()
+        for line in infile:
+            if (line.strip() == ""):
+                continue
+            outfile.write(json.dumps(solve_line(line, aspect_rels, solver_mode, args.seed, args.deadline_ms, args.stats)) + "\n")
+            outfile.flush()
+    finally:
+        if (profiler != None):
+            profiler.disable()
+            profiler.dump_stats(args.profile)
+        if (infile is not sys.stdin):
+            infile.close()
+        if (outfile is not sys.stdout):
+            outfile.close()
+
+if __name__ == "__main__":
+    main()
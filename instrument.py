@@ -0,0 +1,99 @@
+"""
+Opt-in instrumentation of the solver hot paths
+
+    with instrument.collect(profile=True) as stats:
+        solve(...)
+    stats.report()                   plain dict of the numbers below
+    stats.dump_profile("solve.prof") pstats file, e.g. for snakeviz or flameprof
+
+Per instrumented operation it counts calls, wall time, nodes expanded and the peak queue
+(or stack) size of its search, and the greedy merge loop adds one entry per iteration.
+While nothing is collecting, an instrumented function only pays one thread local lookup per
+call. Collection covers the calling thread only, so concurrent solves in other threads (or a
+cancelled SolveJob still finishing) never count into it, and multi-start workers are not
+included. Nested collect() calls restore the outer collection when they end.
+"""
+import cProfile
+import functools
+import threading
+import time
+from contextlib import contextmanager
+
+class Instrumentation:
+    def __init__(self, profile: bool = False):
+        self.operations : dict[str, dict] = {}
+        self.iterations : list[dict] = []
+        self.seconds = 0.0
+        self.profiler = cProfile.Profile() if profile else None
+        # names of the instrumented calls in progress, searches count into the innermost
+        self._calls : list[str] = []
+
+    def _call(self, name: str, func, args, kwargs):
+        stats = self.operations.setdefault(name, {"calls": 0, "seconds": 0.0, "expanded": 0, "queue_peak": 0})
+        self._calls.append(name)
+        start_time = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            stats["calls"] += 1
+            stats["seconds"] += time.perf_counter() - start_time
+            self._calls.pop()
+
+    def count_search(self, expanded: int, queue_peak: int):
+        if (self._calls):
+            stats = self.operations[self._calls[-1]]
+            stats["expanded"] += expanded
+            stats["queue_peak"] = max(stats["queue_peak"], queue_peak)
+
+    def add_iteration(self, stats: dict):
+        self.iterations.append(stats)
+
+    def report(self) -> dict:
+        return {
+            "seconds": self.seconds,
+            "operations": {name: dict(stats) for name, stats in self.operations.items()},
+            "iterations": [dict(stats) for stats in self.iterations],
+        }
+
+    def dump_profile(self, path: str):
+        if (self.profiler == None):
+            raise ValueError("collected without profile=True")
+        self.profiler.dump_stats(path)
+
+# the collecting Instrumentation of each thread as its "active" attribute
+_local = threading.local()
+
+def active() -> Instrumentation | None:
+    return getattr(_local, "active", None)
+
+def instrumented(name: str):
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            stats = getattr(_local, "active", None)
+            if (stats == None):
+                return func(*args, **kwargs)
+            return stats._call(name, func, args, kwargs)
+        return wrapper
+    return decorate
+
+def count_search(expanded: int, queue_peak: int):
+    stats = getattr(_local, "active", None)
+    if (stats != None):
+        stats.count_search(expanded, queue_peak)
+
+@contextmanager
+def collect(profile: bool = False):
+    previous = active()
+    stats = Instrumentation(profile)
+    _local.active = stats
+    if (stats.profiler != None):
+        stats.profiler.enable()
+    start_time = time.perf_counter()
+    try:
+        yield stats
+    finally:
+        stats.seconds = time.perf_counter() - start_time
+        if (stats.profiler != None):
+            stats.profiler.disable()
+        _local.active = previous
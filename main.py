@@ -1,16 +1,17 @@
-import json
-from enum import Enum
-import random
 import myimgui as mig
 from slimgui import imgui as ig
 import glfw
 from pathlib import Path
 import atexit
 from algo import AspectRelations, HexGrid
+from atlas import load_atlas
+from solver import DEFAULT_DEADLINE_MS, IncrementalSolver, SolverMode, SolveJob, is_connected
+from cache import SolutionCache
+from instrument import Instrumentation
+from server import DEFAULT_ADDRESS, RemoteSolveError, RemoteSolveJob
 
-class SolverMode(Enum):
-    FAST = 1
-    SLOW = 2
+# radius 19, 1141 cells, see "Large grids" in the README
+MAX_GRID_SIZE = 20
 
 class TRSApp(mig.ImguiApp):
     def setup(self):
@@ -22,70 +23,98 @@ class TRSApp(mig.ImguiApp):
         self.full_grid = HexGrid(self.grid_size)
         self.aspect_rels = AspectRelations()
         self.placed_aspects : dict[int, str] = {}
+        # the aspects the user placed, placed_aspects also holds the last solution
+        self.user_aspects : dict[int, str] = {}
         self.solver_mode = SolverMode.SLOW
+        self.solve_job : SolveJob | None = None
+        self.solve_stats : list[dict] = []
+        self.deadline_ms = DEFAULT_DEADLINE_MS
+        self.instrument_solves = False
+        self.profile_solves = False
+        self.solve_instrumentation : Instrumentation | None = None
+        # send boards to a running server.py instead of solving here
+        self.use_solve_server = False
+        self.solve_server_address = DEFAULT_ADDRESS
+        self.solve_error : str | None = None
+        # the anytime solution last shown on the grid
+        self.solve_preview : dict[int, str] | None = None
+        self.incremental_solver = IncrementalSolver(self.aspect_rels)
+        self.solution_cache = SolutionCache(path="solution_cache.json")
+        atexit.register(self.solution_cache.save)
         
-        self.hex_texture = mig.load_texture("hex.png")
         self.invisible_table_flags = ig.TableFlags.NO_BORDERS_IN_BODY | ig.TableFlags.NO_SAVED_SETTINGS
         self.invisible_column_flags = ig.TableColumnFlags.NO_REORDER | ig.TableColumnFlags.NO_RESIZE | ig.TableColumnFlags.NO_SORT | ig.TableColumnFlags.NO_HEADER_LABEL
 
-        with open('aspects.json') as aspects_file:
-            self.aspects : dict[str, None | list[str]] = json.loads(aspects_file.read())
-            assert self.aspects != None
-        self.aspect_textures = {}
-        for aspect in self.aspects.keys():
-            self.aspect_textures[aspect] = mig.load_texture(f"templates/{aspect}.png")
+        # every aspect and the hex background share one GL texture, see atlas.py
+        atlas, self.atlas_uvs = load_atlas()
+        self.atlas_texture = mig.upload_texture(atlas)
+
+    def image_button(self, str_id : str, name : str, tint_col = (1.0, 1.0, 1.0, 1.0)) -> bool:
+        uv0, uv1 = self.atlas_uvs[name]
+        return ig.image_button(str_id, self.atlas_texture, image_size=self.button_size, uv0=uv0, uv1=uv1, tint_col=tint_col)
 
     def drop_target(self, id, grid_id, pos):
         aspect = self.placed_aspects.get(grid_id)
-        if (aspect in self.aspect_textures):
+        if (aspect in self.aspect_rels.aspect_ids):
             ig.set_cursor_pos(pos)
-            if (ig.image_button(f"grid_image_button_{id}", self.aspect_textures[aspect], image_size=self.button_size)):
+            if (self.image_button(f"grid_image_button_{id}", aspect)):
+                self.cancel_solve()
                 self.placed_aspects.pop(grid_id)
+                self.user_aspects.pop(grid_id, None)
             if (ig.begin_drag_drop_target()):
                 payload : ig.Payload = ig.accept_drag_drop_payload("aspect_dd", ig.DragDropFlags.NONE)
                 if (payload != None):
+                    self.cancel_solve()
                     self.placed_aspects[grid_id] = payload.data().decode('utf-8')
+                    self.user_aspects[grid_id] = self.placed_aspects[grid_id]
                 ig.end_drag_drop_target()
             
             # disabled background
             ig.set_cursor_pos(pos)
             ig.begin_disabled()
-            ig.image_button(f"grid_image_button_bg_{id}", self.hex_texture, image_size=self.button_size, tint_col=(0.4, 0.6, 0.4, 0.5))
+            self.image_button(f"grid_image_button_bg_{id}", "hex", tint_col=(0.4, 0.6, 0.4, 0.5))
             ig.end_disabled()
-        elif (not grid_id in self.grid.disabled_nodes):
+        elif (not self.grid.is_disabled(grid_id)):
             ig.set_cursor_pos(pos)
-            if (ig.image_button(f"grid_image_button_{id}", self.hex_texture, image_size=self.button_size)):
+            if (self.image_button(f"grid_image_button_{id}", "hex")):
                 # self.grid.remove_id(grid_id)
+                self.cancel_solve()
                 self.grid.disable_id(grid_id)
             if (ig.begin_drag_drop_target()):
                 payload : ig.Payload = ig.accept_drag_drop_payload("aspect_dd", ig.DragDropFlags.NONE)
                 if (payload != None):
+                    self.cancel_solve()
                     self.placed_aspects[grid_id] = payload.data().decode('utf-8')
+                    self.user_aspects[grid_id] = self.placed_aspects[grid_id]
                 ig.end_drag_drop_target()
         else:
             ig.set_cursor_pos(pos)
-            if (ig.image_button(f"grid_image_button_dis_{id}", self.hex_texture, image_size=self.button_size, tint_col=(0.6, 0.4, 0.4, 0.5))):
+            if (self.image_button(f"grid_image_button_dis_{id}", "hex", tint_col=(0.6, 0.4, 0.4, 0.5))):
                 # self.grid.add_node(self.full_grid., grid_id)
+                self.cancel_solve()
                 self.grid.enable_id(grid_id)
 
-    def build_grid(self):
-        ig.begin_child("ch1", child_flags = ig.ChildFlags.AUTO_RESIZE_X | ig.ChildFlags.AUTO_RESIZE_Y | ig.ChildFlags.BORDERS)
-        ig.push_style_color(ig.Col.BUTTON, (0,0,0,0))
-        button_coords : list[tuple[int, int]] = []
-        count = 0
+    def layout_grid(self) -> list[tuple[tuple[int, int], int]]:
+        button_coords : list[tuple[int, int, int]] = []
         for node_id in self.full_grid.all_nodes():
             coords = self.full_grid.id_to_coord.get(node_id)
             pos = (coords[1] * self.horz_spacing, (coords[0] * self.vert_spacing1) + (coords[1] * self.vert_spacing2), node_id)
             button_coords.append(pos)
-        if (len(button_coords) != 0):
-            xs, ys, _ = zip(*button_coords)
-            min_x = min(xs)
-            min_y = min(ys)
-            x_offset = abs(min(0, min_x))
-            y_offset = abs(min(0, min_y))
-            for x, y, id in button_coords:
-                self.drop_target(count, id, (x + x_offset, y + y_offset))
-                count += 1
+        if (len(button_coords) == 0):
+            return []
+        xs, ys, _ = zip(*button_coords)
+        x_offset = abs(min(0, min(xs)))
+        y_offset = abs(min(0, min(ys)))
+        return [((x + x_offset, y + y_offset), id) for x, y, id in button_coords]
+
+    def build_grid(self):
+        ig.begin_child("ch1", child_flags = ig.ChildFlags.AUTO_RESIZE_X | ig.ChildFlags.AUTO_RESIZE_Y | ig.ChildFlags.BORDERS)
+        ig.push_style_color(ig.Col.BUTTON, (0,0,0,0))
+        # positions only change with the grid size and the UI scale, which clear the layout
+        if (self.grid_layout == None):
+            self.grid_layout = self.layout_grid()
+        for count, (pos, id) in enumerate(self.grid_layout):
+            self.drop_target(count, id, pos)
         ig.pop_style_color()
         ig.end_child()
     
@@ -93,7 +122,6 @@ class TRSApp(mig.ImguiApp):
         if (ig.begin_tooltip()):
             num_cols = len(self.aspect_rels.aspect_relations[aspect]) + 1
             aspect_names = list(self.aspect_rels.aspect_children.get(aspect, [])) + [aspect] + list(self.aspect_rels.aspect_parents.get(aspect, []))
-            aspect_textures = [self.aspect_textures[a] for a in aspect_names]
             aspect_index = aspect_names.index(aspect)
             if (ig.begin_table(f"aspect_img_button_{aspect}_tooltip", num_cols, self.invisible_table_flags)):
                 for i in range(num_cols):
@@ -107,11 +135,12 @@ class TRSApp(mig.ImguiApp):
                     ig.text(aspect_name)
                 # aspect images
                 ig.table_next_row()
-                for i, aspect_texture in enumerate(aspect_textures):
+                for i, aspect_name in enumerate(aspect_names):
                     ig.table_set_column_index(i)
                     if (i == aspect_index):
                         ig.table_set_bg_color(ig.TableBgTarget.CELL_BG, (0.25, 0.35, 0.6, 1), i)
-                    ig.image(aspect_texture, self.button_size)
+                    uv0, uv1 = self.atlas_uvs[aspect_name]
+                    ig.image(self.atlas_texture, self.button_size, uv0, uv1)
                 ig.end_table()
             ig.end_tooltip()
 
@@ -119,8 +148,8 @@ class TRSApp(mig.ImguiApp):
         ig.begin_child("ch2", child_flags = ig.ChildFlags.AUTO_RESIZE_X | ig.ChildFlags.AUTO_RESIZE_Y | ig.ChildFlags.BORDERS)
         cols = 6
         count = 0
-        for aspect in self.aspects.keys():
-            ig.image_button(f"aspect_img_button_{aspect}", self.aspect_textures[aspect], image_size=self.button_size)
+        for aspect in self.aspect_rels.aspect_names:
+            self.image_button(f"aspect_img_button_{aspect}", aspect)
             if (ig.is_item_hovered()):
                 self.build_aspect_tooltip(aspect)
             if (ig.begin_drag_drop_source()):
@@ -132,48 +161,96 @@ class TRSApp(mig.ImguiApp):
         ig.end_child()
 
     def reset(self):
+        self.cancel_solve()
         self.placed_aspects = {}
+        self.user_aspects = {}
         self.grid = HexGrid(self.grid_size)
         self.full_grid = HexGrid(self.grid_size)
+        self.grid_layout = None
+        self.incremental_solver = IncrementalSolver(self.aspect_rels)
 
     def solve(self):
-        #todo: fix existing aspects getting overwritten in small grids
-        contiguous_sets = self.grid.split_contiguous_nodes(self.placed_aspects.keys())
-        starting_sets = len(contiguous_sets)
-        iters = 0
-        while (len(contiguous_sets) > 1 and iters < starting_sets*2):
-            random.shuffle(contiguous_sets)
-            setA = contiguous_sets[0]
-            best_solution = None
-            best_cost = 999999999
-
-            for node in setA:
-                others = [x for sl in contiguous_sets[1:] for x in sl]
-                path_length = 0
-                while (path_length < self.grid_size * 2):
-                    grid_path = self.grid.find_path_minimum_length(node, others, path_length, list(self.placed_aspects.keys()))
-                    if (grid_path == None):
-                        path_length += 1
-                        continue
-                    aspect_path = self.aspect_rels.find_path_exact_length(self.placed_aspects[grid_path[0]], self.placed_aspects[grid_path[-1]], len(grid_path)-1)
-                    if (aspect_path == None):
-                        path_length = len(grid_path) + 1
-                        continue
-                    costs = [self.aspect_rels.aspect_costs[x] for x in aspect_path[1:-1]]
-                    solution_cost = sum(costs)
-                    solution = zip(grid_path[1:-1], aspect_path[1:-1])
-                    if (solution_cost <= best_cost):
-                        best_cost = solution_cost
-                        best_solution = solution
-                    break
-                if (best_solution != None and self.solver_mode == SolverMode.FAST):
-                    break
-            
-            if (best_solution != None):
-                self.placed_aspects.update(best_solution)
-            contiguous_sets = self.grid.split_contiguous_nodes(self.placed_aspects.keys())
-            random.shuffle(contiguous_sets)
-            iters += 1
+        self.cancel_solve()
+        self.solve_stats = []
+        self.solve_error = None
+        cached = self.solution_cache.get(self.grid, self.placed_aspects, self.solver_mode)
+        if (cached != None):
+            self.placed_aspects = cached
+            return
+        if (self.use_solve_server):
+            self.solve_job = RemoteSolveJob(self.solve_server_address, self.grid, self.aspect_rels, self.placed_aspects, self.solver_mode, self.deadline_ms)
+            return
+        self.solve_job = SolveJob(self.grid, self.aspect_rels, self.placed_aspects, self.solver_mode, self.incremental_solver, self.deadline_ms,
+                                  self.instrument_solves, self.profile_solves, self.user_aspects)
+
+    def cancel_solve(self):
+        if (self.solve_job != None):
+            self.solve_job.cancel()
+            self.solve_job = None
+        self.solve_preview = None
+
+    def poll_solve(self):
+        # edits cancel the job, so a finished job always matches the current board
+        if (self.solve_job != None and self.solve_job.best != None and self.solve_job.best is not self.solve_preview):
+            # show anytime improvements as they come, cancelling keeps the last one
+            self.solve_preview = self.solve_job.best
+            self.placed_aspects = dict(self.solve_preview)
+        if (self.solve_job != None and self.solve_job.done()):
+            job = self.solve_job
+            self.solve_job = None
+            self.solve_preview = None
+            if (isinstance(job.error, RemoteSolveError)):
+                self.solve_error = str(job.error)
+            elif (job.error != None):
+                raise job.error
+            if (job.instrumentation != None):
+                self.solve_instrumentation = job.instrumentation
+            if (job.result != None):
+                # incomplete greedy results are not kept, another try may connect everything
+                if (is_connected(job.grid, job.result)):
+                    self.solution_cache.put(job.grid, job.placed_aspects, job.solver_mode, job.result)
+                self.placed_aspects = job.result
+                self.solve_stats = job.stats
+
+    def build_solve_controls(self):
+        if (self.solve_job == None):
+            if (ig.button("solve")):
+                self.solve()
+            if (self.solve_error != None):
+                ig.same_line()
+                ig.text_colored((1.0, 0.4, 0.4, 1.0), f"solve server: {self.solve_error}")
+            if (len(self.solve_stats) != 0):
+                ig.same_line()
+                ig.text(f"best of {len(self.solve_stats)} seeds (?)")
+                if (ig.begin_item_tooltip()):
+                    for stats in self.solve_stats:
+                        complete = "" if stats["complete"] else ", incomplete"
+                        ig.text(f"seed {stats['seed']}: cost {stats['cost']}{complete}, {stats['seconds']:.2f}s")
+                    ig.end_tooltip()
+            return
+        elapsed = self.solve_job.elapsed()
+        if (ig.button("cancel")):
+            self.cancel_solve()
+        spinner = "|/-\\"[int(elapsed * 8) % 4]
+        ig.same_line()
+        ig.text(f"{spinner} solving {elapsed:.1f}s")
+
+    def wants_frames(self) -> bool:
+        # keep the solve spinner and anytime improvements moving without input
+        return self.solve_job != None
+
+    def build_solve_stats(self):
+        report = self.solve_instrumentation.report()
+        ig.text(f"{report['seconds'] * 1000:.1f}ms total")
+        for name, stats in report["operations"].items():
+            ig.text(f"{name}: {stats['calls']} calls, {stats['seconds'] * 1000:.1f}ms, "
+                    f"{stats['expanded']} expanded, queue peak {stats['queue_peak']}")
+        for i, stats in enumerate(report["iterations"]):
+            cost = "no link" if stats["cost"] == None else f"cost {stats['cost']}"
+            ig.text(f"merge {i}: {stats['sets']} sets, {stats['candidates']} reachable, {stats['searched']} searched, "
+                    f"{cost}, {stats['seconds'] * 1000:.1f}ms")
+        if (self.solve_instrumentation.profiler != None and ig.button("save solve.prof")):
+            self.solve_instrumentation.dump_profile("solve.prof")
 
     def calculate_scaling(self):
         self.global_scale_factor = max(0.1, self.global_scale_factor)
@@ -185,8 +262,10 @@ class TRSApp(mig.ImguiApp):
         self.horz_spacing = -1 * (((3 * button_scale_size) // 4) + margin)
         self.vert_spacing1 = -1 * (button_scale_size + margin)
         self.vert_spacing2 = -1 * ((button_scale_size + margin) // 2)
+        self.grid_layout : list[tuple[tuple[int, int], int]] | None = None
 
     def mainloop(self):
+        self.poll_solve()
         ig.set_next_window_pos((0, 0), ig.Cond.ONCE)
         ig.set_next_window_size(glfw.get_window_size(self._glfw_window), ig.Cond.ALWAYS)
         ig.begin("Main window", flags = ig.WindowFlags.NO_MOVE | ig.WindowFlags.NO_RESIZE | ig.WindowFlags.NO_COLLAPSE | ig.WindowFlags.MENU_BAR | ig.WindowFlags.NO_TITLE_BAR | ig.WindowFlags.ALWAYS_AUTO_RESIZE)
@@ -200,12 +279,47 @@ class TRSApp(mig.ImguiApp):
                     self.calculate_scaling()
 
                 ig.text("Solver mode (?)")
-                ig.set_item_tooltip("Slow checks more solutions to find the 'cheapest' one")
+                ig.set_item_tooltip("Slow checks more solutions to find the 'cheapest' one, optimal finds the cheapest one on small grids, multi-start runs slow with a seed per core and keeps the cheapest, anytime shows a fast solution and improves it until the deadline")
                 if (ig.radio_button("fast##solver_mode", self.solver_mode == SolverMode.FAST)):
                     self.solver_mode = SolverMode.FAST
                 ig.same_line()
                 if (ig.radio_button("slow##solver_mode", self.solver_mode == SolverMode.SLOW)):
                     self.solver_mode = SolverMode.SLOW
+                ig.same_line()
+                if (ig.radio_button("optimal##solver_mode", self.solver_mode == SolverMode.OPTIMAL)):
+                    self.solver_mode = SolverMode.OPTIMAL
+                ig.same_line()
+                if (ig.radio_button("multi-start##solver_mode", self.solver_mode == SolverMode.MULTI_START)):
+                    self.solver_mode = SolverMode.MULTI_START
+                ig.same_line()
+                if (ig.radio_button("anytime##solver_mode", self.solver_mode == SolverMode.ANYTIME)):
+                    self.solver_mode = SolverMode.ANYTIME
+                if (self.solver_mode == SolverMode.ANYTIME):
+                    ig.set_next_item_width(ig.calc_text_size("deadline ms")[0] + self.button_size[0])
+                    res, temp_deadline = ig.input_int("deadline ms", self.deadline_ms, 100, 1000)
+                    if (res):
+                        self.deadline_ms = max(50, min(60000, temp_deadline))
+
+                cache = self.solution_cache
+                ig.text(f"Solution cache: {len(cache)} boards, {cache.hits} hits, {cache.misses} misses")
+                ig.same_line()
+                if (ig.button("clear##solution_cache")):
+                    cache.clear()
+
+                _, self.use_solve_server = ig.checkbox("Solve server (?)", self.use_solve_server)
+                ig.set_item_tooltip("Send boards to a running server.py, which shares its warm solver and cache with everyone using it")
+                if (self.use_solve_server):
+                    ig.same_line()
+                    ig.set_next_item_width(ig.calc_text_size(DEFAULT_ADDRESS)[0] + self.button_size[0])
+                    _, self.solve_server_address = ig.input_text("address##solve_server", self.solve_server_address)
+
+                _, self.show_frame_stats = ig.checkbox("Frame stats", self.show_frame_stats)
+                _, self.instrument_solves = ig.checkbox("Instrument solves", self.instrument_solves)
+                ig.same_line()
+                _, self.profile_solves = ig.checkbox("with cProfile", self.profile_solves)
+                if (self.solve_instrumentation != None and ig.begin_menu("Last solve stats")):
+                    self.build_solve_stats()
+                    ig.end_menu()
                 ig.end_menu()
             ig.end_menu_bar()
 
@@ -218,15 +332,14 @@ class TRSApp(mig.ImguiApp):
             if (ig.button("reset")):
                 self.reset()
             ig.same_line()
-            if (ig.button("solve")):
-                self.solve()
+            self.build_solve_controls()
             ig.table_set_column_index(1)
             ig.set_next_item_width(ig.calc_text_size("grid size")[0] + self.button_size[0])
             res, temp_size = ig.input_int("grid size", self.grid_size, 1, 1)
             if (res):
                 self.grid_size = temp_size
                 self.grid_size = max(2, self.grid_size)
-                self.grid_size = min(10, self.grid_size)
+                self.grid_size = min(MAX_GRID_SIZE, self.grid_size)
                 self.reset()
 
             ig.table_next_row()
@@ -237,5 +350,7 @@ class TRSApp(mig.ImguiApp):
             ig.end_table()
         ig.end()
 
-app = TRSApp(title = 'Thaumcraft Research Solver', width = 1500, height = 1100)
-app.run()
\ No newline at end of file
+if __name__ == "__main__":
+    # guarded so multi-start worker processes can import this module without opening a window
+    app = TRSApp(title = 'Thaumcraft Research Solver', width = 1500, height = 1100)
+    app.run()
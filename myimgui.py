@@ -1,4 +1,6 @@
 import os
+import time
+from collections import deque
 import glfw
 import OpenGL.GL as gl
 from slimgui import imgui
@@ -9,17 +11,20 @@ def load_texture(filename):
     assert filename != None
     # assert os.path.isfile(filename)
     with Image.open(filename) as img:
-        img = img.convert("RGBA")
-        width, height = img.size
-        pixels = img.tobytes()
-
-        texture_id = gl.glGenTextures(1)
-        gl.glBindTexture(gl.GL_TEXTURE_2D, texture_id)
-        gl.glTexParameter(gl.GL_TEXTURE_2D, gl.GL_TEXTURE_MIN_FILTER, gl.GL_LINEAR)
-        gl.glTexParameter(gl.GL_TEXTURE_2D, gl.GL_TEXTURE_MAG_FILTER, gl.GL_LINEAR)
-        gl.glPixelStorei(gl.GL_UNPACK_ROW_LENGTH, 0)
-        gl.glTexImage2D(gl.GL_TEXTURE_2D, 0, gl.GL_RGBA, width, height, 0, gl.GL_RGBA, gl.GL_UNSIGNED_BYTE, pixels)
-        return texture_id
+        return upload_texture(img)
+
+def upload_texture(img):
+    img = img.convert("RGBA")
+    width, height = img.size
+    pixels = img.tobytes()
+
+    texture_id = gl.glGenTextures(1)
+    gl.glBindTexture(gl.GL_TEXTURE_2D, texture_id)
+    gl.glTexParameter(gl.GL_TEXTURE_2D, gl.GL_TEXTURE_MIN_FILTER, gl.GL_LINEAR)
+    gl.glTexParameter(gl.GL_TEXTURE_2D, gl.GL_TEXTURE_MAG_FILTER, gl.GL_LINEAR)
+    gl.glPixelStorei(gl.GL_UNPACK_ROW_LENGTH, 0)
+    gl.glTexImage2D(gl.GL_TEXTURE_2D, 0, gl.GL_RGBA, width, height, 0, gl.GL_RGBA, gl.GL_UNSIGNED_BYTE, pixels)
+    return texture_id
 
 # def _download_cached(url, cache_dir="thaumcraft_research_solver") -> str:
 #     os.makedirs(os.path.expanduser(f"~/.cache/{cache_dir}"), exist_ok=True)
@@ -38,9 +43,20 @@ def load_font():
         font_data = f.read()
         return imgui.get_io().fonts.add_font_from_memory_ttf(font_data, 24)
 
+# full frame rate for this long after the last input, imgui needs a few frames to settle hovers
+ACTIVE_SECONDS = 0.5
+# longest wait for input while idle
+IDLE_TIMEOUT = 0.5
+
+_last_input_time = 0.0
+def _input_callback(*_args):
+    global _last_input_time
+    _last_input_time = time.perf_counter()
+
 _esc_pressed = False
 def _key_callback(_window, key, _scan, action, _mods):
     global _esc_pressed
+    _input_callback()
     if action == glfw.PRESS and key == glfw.KEY_ESCAPE:
         _esc_pressed = True
 
@@ -53,6 +69,9 @@ class ImguiApp:
         self._width = width
         self._height = height
         self._font_scale = 0
+        self.show_frame_stats = False
+        # start time and work time of the recent frames, for the frame stats overlay
+        self._frame_times : deque[tuple[float, float]] = deque(maxlen=240)
 
     def __dispose__(self):
         self._imgui_teardown()
@@ -78,7 +97,11 @@ class ImguiApp:
         imgui.create_context()
         io = imgui.get_io()
         io.config_flags |= imgui.ConfigFlags.NAV_ENABLE_KEYBOARD
-        self._renderer = GlfwRenderer(self._glfw_window, prev_key_callback=_key_callback)
+        self._renderer = GlfwRenderer(self._glfw_window, prev_key_callback=_key_callback, prev_char_callback=_input_callback,
+                                      prev_cursor_pos_callback=_input_callback, prev_mouse_button_callback=_input_callback,
+                                      prev_scroll_callback=_input_callback, prev_window_focus_callback=_input_callback)
+        glfw.set_window_size_callback(self._glfw_window, _input_callback)
+        glfw.set_window_refresh_callback(self._glfw_window, _input_callback)
 
         self._font = load_font()
 
@@ -90,7 +113,12 @@ class ImguiApp:
         self._imgui_setup()
         self.setup()
         while not (glfw.window_should_close(self._glfw_window) or _esc_pressed):
-            glfw.poll_events()
+            # block while nothing happens instead of redrawing an unchanged UI
+            if (self.wants_frames() or time.perf_counter() - _last_input_time < ACTIVE_SECONDS):
+                glfw.poll_events()
+            else:
+                glfw.wait_events_timeout(IDLE_TIMEOUT)
+            frame_start = time.perf_counter()
 
             # Start new imgui frame.
             gl.glClear(int(gl.GL_COLOR_BUFFER_BIT) | int(gl.GL_DEPTH_BUFFER_BIT))
@@ -99,17 +127,37 @@ class ImguiApp:
             imgui.push_font(self._font, self._font_scale)
 
             self.mainloop()
+            if (self.show_frame_stats):
+                self._build_frame_stats()
 
             # ImGui frame rendering.
             imgui.pop_font()
             imgui.render()
             self._renderer.render(imgui.get_draw_data())
+            self._frame_times.append((frame_start, time.perf_counter() - frame_start))
 
             # Swap buffers.
             glfw.swap_buffers(self._glfw_window)
         self.teardown()
         self._imgui_teardown()
 
+    def wants_frames(self) -> bool:
+        # override to keep drawing at full frame rate without input, e.g. while showing progress
+        return False
+
+    def _build_frame_stats(self):
+        now = time.perf_counter()
+        recent = [work for start, work in self._frame_times if now - start < 1]
+        mean_ms = 1000 * sum(recent) / len(recent) if recent else 0
+        idle = not self.wants_frames() and now - _last_input_time >= ACTIVE_SECONDS
+        imgui.set_next_window_pos((imgui.get_io().display_size[0] - 10, 10), imgui.Cond.ALWAYS, (1, 0))
+        imgui.set_next_window_bg_alpha(0.6)
+        flags = imgui.WindowFlags.NO_DECORATION | imgui.WindowFlags.ALWAYS_AUTO_RESIZE | imgui.WindowFlags.NO_INPUTS | imgui.WindowFlags.NO_SAVED_SETTINGS
+        imgui.begin("Frame stats", flags=flags)
+        imgui.text(f"{len(recent)} fps, {mean_ms:.2f}ms per frame")
+        imgui.text("idle, waiting for input" if idle else "active")
+        imgui.end()
+
     def setup(self):
         self.count = 0
 
@@ -0,0 +1,48 @@
+"""
+Seeded generator for research boards in the cli.py JSONL format
+
+    python puzzles.py --seed 1 --count 10 > boards.jsonl
+"""
+import argparse
+import json
+import random
+from algo import AspectRelations, HexGrid
+
+def generate_board(rng: random.Random, aspect_rels: AspectRelations, grid_size: int, board_id: str | None = None) -> dict:
+    """
+    Disables up to 15% of the cells and places 2 to 3 + grid_size // 3 random aspects on the rest
+    """
+    grid = HexGrid(grid_size)
+    nodes = grid.all_nodes()
+    for node in rng.sample(nodes, rng.randint(0, (len(nodes) * 15) // 100)):
+        grid.disable_id(node)
+    free = grid.all_nodes()
+    count = min(len(free), rng.randint(2, 3 + grid_size // 3))
+    placed = {node: rng.choice(aspect_rels.aspect_names) for node in rng.sample(free, count)}
+    return {
+        "id": board_id,
+        "grid_size": grid_size,
+        "disabled": [list(grid.id_to_coord[node]) for node in sorted(grid.disabled_nodes)],
+        "placed": [[*grid.id_to_coord[node], aspect] for node, aspect in placed.items()],
+    }
+
+def generate_corpus(seed: int, count: int, sizes: list[int], aspect_rels: AspectRelations) -> list[dict]:
+    # one rng per size, so adding sizes doesn't change the boards of the others
+    boards = []
+    for grid_size in sizes:
+        rng = random.Random(f"{seed}-{grid_size}")
+        for i in range(count):
+            boards.append(generate_board(rng, aspect_rels, grid_size, f"s{grid_size}-{i}"))
+    return boards
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate random research boards as JSONL")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--count", type=int, default=10, help="boards per grid size")
+    parser.add_argument("--sizes", type=int, nargs="+", default=list(range(2, 11)))
+    args = parser.parse_args()
+    for board in generate_corpus(args.seed, args.count, args.sizes, AspectRelations()):
+        print(json.dumps(board))
+
+if __name__ == "__main__":
+    main()
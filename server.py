@@ -0,0 +1,321 @@
+"""
+Local solve service, one warm AspectRelations and solution cache shared by every client
+
+    python server.py                           listen on 127.0.0.1:8765
+    python server.py --unix /tmp/trs.sock      or on a Unix socket
+
+Clients send boards as JSON lines in the cli.py format and may send the next one before the
+first is answered. Every line gets answers tagged with its "id":
+    {"id": "b1", "status": "queued"}
+    {"id": "b1", "status": "improved", "complete": ..., "cost": ..., "added": [...]}   ANYTIME only
+    {"id": "b1", "status": "done", "complete": ..., "cost": ..., "added": [...], "seconds": ...}
+or {"id": "b1", "status": "error", "error": "..."}. Boards are solved on a process pool that
+loads the aspect snapshot once per worker, so results stream back in the order they finish.
+Identical boards in flight are solved once for everyone waiting on them, and the seeds of a
+MULTI_START board are spread over the pool like separate boards. Complete solutions
+go into a SolutionCache, which answers later boards (any seed, rotations and mirror images
+included) without solving and is saved on shutdown.
+
+RemoteSolveJob is the client side the app uses in place of a SolveJob.
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import random
+import signal
+import socket
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from algo import AspectRelations, HexGrid
+from cache import SolutionCache
+from solver import DEFAULT_DEADLINE_MS, SolverMode, board_from_json, board_to_json, default_seeds, is_connected, solution_cost, solution_to_json, solve, solve_anytime
+
+DEFAULT_ADDRESS = "127.0.0.1:8765"
+
+_worker_aspect_rels : AspectRelations | None = None
+_worker_progress = None
+
+def _init_worker(aspect_rels: AspectRelations, progress: multiprocessing.Queue):
+    global _worker_aspect_rels, _worker_progress
+    # Ctrl+C stops the server, which then shuts the workers down
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    _worker_aspect_rels = aspect_rels
+    _worker_progress = progress
+
+def _ready() -> bool:
+    return _worker_aspect_rels != None
+
+def _solve_board(key: str, grid: HexGrid, placed_aspects: dict[int, str], solver_mode: SolverMode, seed: int | None, deadline_ms: float) -> tuple[dict[int, str], float]:
+    start_time = time.perf_counter()
+    rng = None if seed == None else random.Random(seed)
+    if (solver_mode == SolverMode.ANYTIME):
+        solved = dict(placed_aspects)
+        for solved in solve_anytime(grid, _worker_aspect_rels, placed_aspects, deadline_ms, rng=rng):
+            _worker_progress.put((key, solved))
+    else:
+        solved = solve(grid, _worker_aspect_rels, placed_aspects, solver_mode, rng=rng, deadline_ms=deadline_ms)
+    return solved, time.perf_counter() - start_time
+
+def parse_address(address: str) -> tuple[str, int] | str:
+    # host:port, anything with a / in it is a Unix socket path
+    if ("/" in address):
+        return address
+    host, _, port = address.rpartition(":")
+    return (host or "127.0.0.1", int(port))
+
+class _InFlight:
+    def __init__(self, grid: HexGrid, placed_aspects: dict[int, str], future: asyncio.Future):
+        self.grid = grid
+        self.placed_aspects = placed_aspects
+        self.future = future
+        # (board id, send) of every request waiting on it, for the ANYTIME improvements
+        self.listeners : list[tuple] = []
+
+class SolveServer:
+    def __init__(self, aspect_rels: AspectRelations, cache: SolutionCache, workers: int | None = None):
+        self.aspect_rels = aspect_rels
+        self.cache = cache
+        self.workers = workers or os.cpu_count() or 1
+        self.in_flight : dict[str, _InFlight] = {}
+        self.solves = 0
+        self.coalesced = 0
+        self.pool : ProcessPoolExecutor | None = None
+        # (key, solution) of ANYTIME improvements from the workers
+        self.progress : multiprocessing.Queue | None = None
+
+    async def serve(self, address: tuple[str, int] | str, started: asyncio.Event | None = None):
+        # spawned rather than forked, a forked worker would inherit client sockets and keep them open
+        context = multiprocessing.get_context("spawn")
+        self.progress = context.Queue()
+        self.pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=context, initializer=_init_worker, initargs=(self.aspect_rels, self.progress))
+        forward = asyncio.create_task(self._forward_progress())
+        try:
+            # workers start on demand, get them all loaded before the first board
+            loop = asyncio.get_running_loop()
+            await asyncio.gather(*[loop.run_in_executor(self.pool, _ready) for _ in range(self.workers)])
+            if (isinstance(address, str)):
+                server = await asyncio.start_unix_server(self.handle, path=address)
+            else:
+                server = await asyncio.start_server(self.handle, *address)
+            async with server:
+                if (started != None):
+                    started.set()
+                await server.serve_forever()
+        finally:
+            self.cache.save()
+            self.pool.shutdown(wait=False, cancel_futures=True)
+            # wakes the thread reading the queue
+            self.progress.put(None)
+            forward.cancel()
+
+    async def _forward_progress(self):
+        # the queue is read on a thread, the listeners are only touched on the event loop
+        loop = asyncio.get_running_loop()
+        while True:
+            message = await loop.run_in_executor(None, self.progress.get)
+            if (message == None):
+                return
+            key, solved = message
+            job = self.in_flight.get(key)
+            if (job == None):
+                continue
+            solution = solution_to_json(job.grid, self.aspect_rels, job.placed_aspects, solved)
+            for board_id, send in list(job.listeners):
+                await send({"id": board_id, "status": "improved", **solution})
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        lock = asyncio.Lock()
+
+        async def send(message: dict):
+            async with lock:
+                try:
+                    writer.write((json.dumps(message) + "\n").encode("utf-8"))
+                    await writer.drain()
+                except ConnectionError:
+                    # the client left, solves in flight still finish into the cache
+                    pass
+
+        requests = []
+        try:
+            while (line := await reader.readline()):
+                if (line.strip()):
+                    requests.append(asyncio.create_task(self.solve_request(line, send)))
+            await asyncio.gather(*requests)
+        except asyncio.CancelledError:
+            # the server is shutting down
+            pass
+        finally:
+            writer.close()
+
+    async def solve_request(self, line: bytes, send):
+        result = {"id": None}
+        try:
+            board = json.loads(line)
+            result["id"] = board.get("id")
+            grid, placed_aspects = board_from_json(board, self.aspect_rels)
+            solver_mode = SolverMode[board.get("mode", "slow").upper()]
+            seed = board.get("seed")
+            deadline_ms = float(board.get("deadline_ms", DEFAULT_DEADLINE_MS))
+        except (KeyError, ValueError, TypeError, AttributeError) as e:
+            await send({**result, "status": "error", "error": f"{type(e).__name__}: {e}"})
+            return
+
+        cached = self.cache.get(grid, placed_aspects, solver_mode)
+        if (cached != None):
+            await send({**result, "status": "done", **solution_to_json(grid, self.aspect_rels, placed_aspects, cached), "seconds": 0.0, "cached": True})
+            return
+        await send({**result, "status": "queued"})
+
+        key = json.dumps([board_to_json(grid, placed_aspects), solver_mode.name, seed, deadline_ms])
+        job = self.in_flight.get(key)
+        if (job == None):
+            if (solver_mode == SolverMode.MULTI_START):
+                future = asyncio.ensure_future(self._solve_multi_start(key, grid, placed_aspects, deadline_ms))
+            else:
+                future = asyncio.get_running_loop().run_in_executor(self.pool, _solve_board, key, grid, placed_aspects, solver_mode, seed, deadline_ms)
+            job = _InFlight(grid, placed_aspects, future)
+            self.in_flight[key] = job
+            future.add_done_callback(lambda _: self.in_flight.pop(key, None))
+            self.solves += 1
+        else:
+            self.coalesced += 1
+        listener = (result["id"], send)
+        job.listeners.append(listener)
+        try:
+            # shielded, one client going away must not cancel the solve for the others
+            solved, seconds = await asyncio.shield(job.future)
+        except Exception as e:
+            await send({**result, "status": "error", "error": f"{type(e).__name__}: {e}"})
+            return
+        finally:
+            job.listeners.remove(listener)
+        solution = solution_to_json(grid, self.aspect_rels, placed_aspects, solved)
+        if (solution["complete"]):
+            self.cache.put(grid, placed_aspects, solver_mode, solved)
+        await send({**result, "status": "done", **solution, "seconds": seconds})
+
+    async def _solve_multi_start(self, key: str, grid: HexGrid, placed_aspects: dict[int, str], deadline_ms: float) -> tuple[dict[int, str], float]:
+        # the seeds of solve_multi_start as SLOW solves on this pool, a pool worker can't start a pool of its own
+        start_time = time.perf_counter()
+        loop = asyncio.get_running_loop()
+        results = await asyncio.gather(*[loop.run_in_executor(self.pool, _solve_board, key, grid, placed_aspects, SolverMode.SLOW, seed, deadline_ms) for seed in default_seeds()])
+        solutions = [solved for solved, _ in results]
+        # cheapest complete solution, ties going to the earlier seed
+        best = min(range(len(solutions)), key=lambda i: (not is_connected(grid, solutions[i]), solution_cost(self.aspect_rels, placed_aspects, solutions[i]), i))
+        return solutions[best], time.perf_counter() - start_time
+
+class RemoteSolveError(Exception):
+    pass
+
+class RemoteSolveJob:
+    """
+    Sends one board to a solve server on a thread, with the attributes of a SolveJob:
+    result, best (ANYTIME improvements), error, done(), cancel() and elapsed().
+    Connection problems and error answers end up in error as a RemoteSolveError.
+    Cancelling closes the connection, the server still finishes the solve into its cache.
+    """
+    def __init__(self, address: str, grid: HexGrid, aspect_rels: AspectRelations, placed_aspects: dict[int, str], solver_mode: SolverMode, deadline_ms: float = DEFAULT_DEADLINE_MS, timeout: float = 600.0):
+        self.address = parse_address(address)
+        self.grid = grid.copy()
+        self.aspect_rels = aspect_rels
+        self.placed_aspects = dict(placed_aspects)
+        self.solver_mode = solver_mode
+        self.deadline_ms = deadline_ms
+        self.timeout = timeout
+        self.result : dict[int, str] | None = None
+        self.best : dict[int, str] | None = None
+        # SolveJob fills these for MULTI_START and instrumented solves, the server reports neither
+        self.stats : list[dict] = []
+        self.instrumentation = None
+        self.error : Exception | None = None
+        self.start_time = time.perf_counter()
+        self.end_time : float | None = None
+        self._cancel = threading.Event()
+        self._socket : socket.socket | None = None
+        self._thread = threading.Thread(target=self._run, name="remote solve job", daemon=True)
+        self._thread.start()
+
+    def _solution(self, answer: dict) -> dict[int, str]:
+        solved = dict(self.placed_aspects)
+        for q, r, aspect in answer["added"]:
+            solved[self.grid.coord_to_id[(q, r)]] = aspect
+        return solved
+
+    def _run(self):
+        board = {"id": "app", **board_to_json(self.grid, self.placed_aspects), "mode": self.solver_mode.name.lower(), "deadline_ms": self.deadline_ms}
+        try:
+            family = socket.AF_UNIX if isinstance(self.address, str) else socket.AF_INET
+            self._socket = socket.socket(family, socket.SOCK_STREAM)
+            self._socket.settimeout(self.timeout)
+            self._socket.connect(self.address)
+            if (self.cancelled()):
+                # cancelled before there was a socket to shut down
+                return
+            self._socket.sendall((json.dumps(board) + "\n").encode("utf-8"))
+            with self._socket.makefile("r", encoding="utf-8") as answers:
+                for line in answers:
+                    answer = json.loads(line)
+                    if (answer["status"] == "error"):
+                        raise RemoteSolveError(answer["error"])
+                    if (answer["status"] == "improved"):
+                        self.best = self._solution(answer)
+                    elif (answer["status"] == "done"):
+                        self.result = self._solution(answer)
+                        break
+            if (self.result == None and not self.cancelled()):
+                raise RemoteSolveError("the solve server closed the connection")
+        except (OSError, ValueError, KeyError) as e:
+            if (not self.cancelled()):
+                self.error = RemoteSolveError(f"{type(e).__name__}: {e}")
+        except RemoteSolveError as e:
+            self.error = e
+        finally:
+            if (self._socket != None):
+                self._socket.close()
+            self.end_time = time.perf_counter()
+
+    def cancel(self):
+        self._cancel.set()
+        if (self._socket != None):
+            # unblocks the read on the job thread
+            try:
+                self._socket.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def cancelled(self) -> bool:
+        return self._cancel.is_set()
+
+    def done(self) -> bool:
+        return self.end_time != None
+
+    def elapsed(self) -> float:
+        return (self.end_time or time.perf_counter()) - self.start_time
+
+def _interrupt(signum, frame):
+    raise KeyboardInterrupt
+
+def main(argv: list[str] | None = None):
+    parser = argparse.ArgumentParser(description="Serve Thaumcraft research solves to local clients")
+    parser.add_argument("--address", default=DEFAULT_ADDRESS, help="host:port to listen on")
+    parser.add_argument("--unix", metavar="PATH", help="listen on a Unix socket instead")
+    parser.add_argument("--workers", type=int, default=None, help="solver processes, one per core by default")
+    parser.add_argument("--cache", default="server_cache.json", help="solution cache file")
+    parser.add_argument("--addon", action="append", default=[], metavar="PATH", help="extra aspect pack in the aspects.json format, may repeat")
+    args = parser.parse_args(argv)
+
+    server = SolveServer(AspectRelations(addon_files=args.addon), SolutionCache(1024, args.cache), args.workers)
+    address = args.unix or parse_address(args.address)
+    print(f"serving on {address} with {server.workers} workers", flush=True)
+    # stopped like Ctrl+C, which saves the cache
+    signal.signal(signal.SIGTERM, _interrupt)
+    try:
+        asyncio.run(server.serve(address))
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,449 @@
+import multiprocessing
+import multiprocessing.pool
+import os
+import random
+import threading
+import time
+from enum import Enum
+import numpy as np
+import instrument
+from typing import Callable, Iterator
+from algo import UNREACHABLE, AspectRelations, HexGrid, SteinerConnection, find_cheapest_connection, set_lower_bounds
+
+class SolverMode(Enum):
+    FAST = 1
+    SLOW = 2
+    OPTIMAL = 3
+    MULTI_START = 4
+    ANYTIME = 5
+
+DEFAULT_DEADLINE_MS = 1000
+
+def default_seeds() -> list[int]:
+    return list(range(os.cpu_count() or 1))
+
+def solution_cost(aspect_rels: AspectRelations, placed_aspects: dict[int, str], solved_aspects: dict[int, str]) -> int:
+    return sum([aspect_rels.aspect_costs[a] for node, a in solved_aspects.items() if node not in placed_aspects])
+
+def is_connected(grid: HexGrid, placed_aspects: dict[int, str]) -> bool:
+    return len(grid.split_contiguous_nodes(placed_aspects.keys())) <= 1
+
+def board_from_json(board: dict, aspect_rels: AspectRelations) -> tuple[HexGrid, dict[int, str]]:
+    """
+    Reads {"grid_size": int, "disabled": [[q, r], ...], "placed": [[q, r, aspect], ...]}
+    with axial coordinates, raises ValueError for cells off the grid, unknown aspects and
+    aspects placed on disabled or already placed cells
+    """
+    grid = HexGrid(int(board["grid_size"]))
+    for q, r in board.get("disabled", []):
+        if ((q, r) not in grid.coord_to_id):
+            raise ValueError(f"disabled cell ({q}, {r}) is not on a size {board['grid_size']} grid")
+        grid.disable_id(grid.coord_to_id[(q, r)])
+    placed_aspects : dict[int, str] = {}
+    for q, r, aspect in board.get("placed", []):
+        if ((q, r) not in grid.coord_to_id):
+            raise ValueError(f"placed cell ({q}, {r}) is not on a size {board['grid_size']} grid")
+        if (aspect not in aspect_rels.aspect_ids):
+            raise ValueError(f"unknown aspect {aspect}")
+        node = grid.coord_to_id[(q, r)]
+        if (grid.is_disabled(node)):
+            raise ValueError(f"placed cell ({q}, {r}) is disabled")
+        if (node in placed_aspects):
+            raise ValueError(f"cell ({q}, {r}) is placed twice")
+        placed_aspects[node] = aspect
+    return grid, placed_aspects
+
+def board_to_json(grid: HexGrid, placed_aspects: dict[int, str]) -> dict:
+    # the inverse of board_from_json, grid_size is the size the UI shows, one more than the axial radius
+    return {
+        "grid_size": grid.radius + 1,
+        "disabled": [list(grid.id_to_coord[node]) for node in sorted(grid.disabled_nodes)],
+        "placed": [[*grid.id_to_coord[node], aspect] for node, aspect in sorted(placed_aspects.items())],
+    }
+
+def solution_to_json(grid: HexGrid, aspect_rels: AspectRelations, placed_aspects: dict[int, str], solved_aspects: dict[int, str]) -> dict:
+    return {
+        "complete": is_connected(grid, solved_aspects),
+        "cost": solution_cost(aspect_rels, placed_aspects, solved_aspects),
+        "added": [[*grid.id_to_coord[node], aspect] for node, aspect in solved_aspects.items() if node not in placed_aspects],
+    }
+
+def solve(grid: HexGrid, aspect_rels: AspectRelations, placed_aspects: dict[int, str], solver_mode: SolverMode, cancel: threading.Event | None = None, rng: random.Random | None = None, deadline_ms: float = DEFAULT_DEADLINE_MS) -> dict[int, str] | None:
+    """
+    Returns placed_aspects plus the aspects connecting them, or None if cancelled.
+    The greedy modes shuffle with rng, so a seeded rng gives a reproducible result.
+    ANYTIME returns the best solution found within deadline_ms.
+    """
+    if (solver_mode == SolverMode.MULTI_START):
+        result = solve_multi_start(grid, aspect_rels, placed_aspects, default_seeds(), cancel)
+        return None if result == None else result[0]
+    if (solver_mode == SolverMode.ANYTIME):
+        best = None
+        for best in solve_anytime(grid, aspect_rels, placed_aspects, deadline_ms, cancel, rng):
+            pass
+        return None if cancel != None and cancel.is_set() else best
+
+    rng = rng or random.Random()
+    placed_aspects = dict(placed_aspects)
+    if (solver_mode == SolverMode.OPTIMAL):
+        solution = SteinerConnection(grid, aspect_rels, placed_aspects, cancel=cancel).solve()
+        if (cancel != None and cancel.is_set()):
+            return None
+        if (solution != None):
+            placed_aspects.update(solution)
+            return placed_aspects
+        # too many separate aspects or out of time, fall back to the greedy search
+
+    search = lambda starts, ends: find_cheapest_connection(grid, aspect_rels, placed_aspects, starts, ends)
+    if (_connect_greedy(grid, aspect_rels, placed_aspects, solver_mode, rng, cancel, search) == None):
+        return None
+    return placed_aspects
+
+def _connect_greedy(grid: HexGrid, aspect_rels: AspectRelations, placed_aspects: dict[int, str], solver_mode: SolverMode, rng: random.Random, cancel: threading.Event | None, search: Callable[[list[int], list[int]], list[tuple[int, str]] | None]) -> list[list[tuple[int, str]]] | None:
+    """
+    Links the contiguous sets of placed_aspects one connection at a time, adding the new aspects
+    to placed_aspects. search(starts, ends) finds a connection on the current placed_aspects.
+    Returns the chosen connections including their ends, or None if cancelled.
+    """
+    connections = []
+    contiguous_sets = grid.split_contiguous_nodes(placed_aspects.keys())
+    starting_sets = len(contiguous_sets)
+    iters = 0
+    while (len(contiguous_sets) > 1 and iters < starting_sets*2):
+        iteration_start = time.perf_counter()
+        rng.shuffle(contiguous_sets)
+        best_solution = None
+        best_cost = 999999999
+        searched = 0
+
+        # sets in order of their lower bound, shuffled among equals, skipping those that cannot reach the others.
+        # All sets are scored in one batch over the placed cells, see set_lower_bounds
+        bounds = set_lower_bounds(grid, aspect_rels, placed_aspects, contiguous_sets).min(axis=1)
+        candidates = [i for i in np.argsort(bounds, kind="stable").tolist() if bounds[i] < UNREACHABLE]
+
+        # fast links the most promising set to its cheapest neighbor, slow takes the cheapest link of any set
+        for i in candidates:
+            if (cancel != None and cancel.is_set()):
+                return None
+            if (bounds[i] >= best_cost):
+                break
+            others = [x for sl in contiguous_sets[:i] + contiguous_sets[i+1:] for x in sl]
+            connection = search(list(contiguous_sets[i]), others)
+            searched += 1
+            if (connection == None):
+                continue
+            costs = [aspect_rels.aspect_costs[aspect] for _, aspect in connection[1:-1]]
+            solution_cost = sum(costs)
+            if (solution_cost < best_cost):
+                best_cost = solution_cost
+                best_solution = connection
+            if (solver_mode == SolverMode.FAST):
+                break
+
+        if (best_solution != None):
+            placed_aspects.update(best_solution[1:-1])
+            connections.append(best_solution)
+        stats = instrument.active()
+        if (stats != None):
+            stats.add_iteration({
+                "sets": len(contiguous_sets),
+                "candidates": len(candidates),
+                "searched": searched,
+                "cost": None if best_solution == None else best_cost,
+                "seconds": time.perf_counter() - iteration_start,
+            })
+        contiguous_sets = grid.split_contiguous_nodes(placed_aspects.keys())
+        rng.shuffle(contiguous_sets)
+        iters += 1
+    return connections
+
+class _Deadline:
+    # stands in for the cancel event of _connect_greedy, set once the time is up or on cancel
+    def __init__(self, end_time: float, cancel: threading.Event | None):
+        self.end_time = end_time
+        self.cancel = cancel
+
+    def is_set(self) -> bool:
+        return time.perf_counter() >= self.end_time or (self.cancel != None and self.cancel.is_set())
+
+def solve_anytime(grid: HexGrid, aspect_rels: AspectRelations, placed_aspects: dict[int, str], deadline_ms: float, cancel: threading.Event | None = None, rng: random.Random | None = None) -> Iterator[dict[int, str]]:
+    """
+    Yields a FAST solution, then every better one local search finds until deadline_ms after
+    the call. A step rips up a connection, the most expensive one not tried since the last
+    improvement, and links the pieces again the SLOW way. Once every connection was tried it
+    rips up two at random. Better means complete where the last one was not, or cheaper.
+    Stops early on cancel, the first solution is always yielded unless cancelled.
+    """
+    rng = rng or random.Random()
+    deadline = _Deadline(time.perf_counter() + deadline_ms / 1000, cancel)
+    solved_aspects = dict(placed_aspects)
+    search = lambda starts, ends: find_cheapest_connection(grid, aspect_rels, solved_aspects, starts, ends)
+    connections = _connect_greedy(grid, aspect_rels, solved_aspects, SolverMode.FAST, rng, cancel, search)
+    if (connections == None):
+        return
+    best_key = (not is_connected(grid, solved_aspects), solution_cost(aspect_rels, placed_aspects, solved_aspects))
+    yield dict(solved_aspects)
+
+    chain_cost = lambda connection: sum([aspect_rels.aspect_costs[aspect] for _, aspect in connection[1:-1]])
+    tried : set[int] = set()
+    while (not deadline.is_set() and len(connections) != 0):
+        untried = [i for i in range(len(connections)) if i not in tried]
+        if (untried):
+            ripped = [max(untried, key=lambda i: chain_cost(connections[i]))]
+            tried.add(ripped[0])
+        elif (len(connections) == 1):
+            # ripping up the only connection again would find the same one
+            break
+        else:
+            ripped = rng.sample(range(len(connections)), min(2, len(connections)))
+        kept = [c for i, c in enumerate(connections) if i not in ripped]
+        solved_aspects.clear()
+        solved_aspects.update(placed_aspects)
+        for connection in kept:
+            solved_aspects.update(connection[1:-1])
+        added = _connect_greedy(grid, aspect_rels, solved_aspects, SolverMode.SLOW, rng, deadline, search)
+        if (added == None):
+            break
+        key = (not is_connected(grid, solved_aspects), solution_cost(aspect_rels, placed_aspects, solved_aspects))
+        if (key < best_key):
+            best_key = key
+            connections = kept + added
+            tried = set()
+            yield dict(solved_aspects)
+
+_worker_aspect_rels : AspectRelations | None = None
+# the process pool of solve_multi_start, kept between solves and replaced once terminated
+_pool : multiprocessing.pool.Pool | None = None
+_pool_args : tuple[AspectRelations, int] | None = None
+_pool_lock = threading.Lock()
+
+def _init_worker(aspect_rels: AspectRelations):
+    # sent once per worker process instead of with every seed
+    global _worker_aspect_rels
+    _worker_aspect_rels = aspect_rels
+
+def _solve_seed(grid: HexGrid, placed_aspects: dict[int, str], seed: int) -> tuple[dict[int, str], dict]:
+    start_time = time.perf_counter()
+    solved = solve(grid, _worker_aspect_rels, placed_aspects, SolverMode.SLOW, rng=random.Random(seed))
+    stats = {
+        "seed": seed,
+        "complete": is_connected(grid, solved),
+        "cost": solution_cost(_worker_aspect_rels, placed_aspects, solved),
+        "seconds": time.perf_counter() - start_time,
+    }
+    return solved, stats
+
+def _shared_pool(aspect_rels: AspectRelations, workers: int) -> multiprocessing.pool.Pool:
+    global _pool, _pool_args
+    with _pool_lock:
+        if (_pool != None and _pool_args != (aspect_rels, workers)):
+            _pool.terminate()
+            _pool = None
+        if (_pool == None):
+            _pool = multiprocessing.Pool(workers, initializer=_init_worker, initargs=(aspect_rels,))
+            _pool_args = (aspect_rels, workers)
+        return _pool
+
+def _terminate_pool(pool: multiprocessing.pool.Pool):
+    global _pool
+    with _pool_lock:
+        if (_pool is pool):
+            _pool = None
+    pool.terminate()
+
+def solve_multi_start(grid: HexGrid, aspect_rels: AspectRelations, placed_aspects: dict[int, str], seeds: list[int], cancel: threading.Event | None = None, max_workers: int | None = None) -> tuple[dict[int, str], list[dict]] | None:
+    """
+    Runs a SLOW solve per seed on a process pool and keeps the cheapest complete solution,
+    ties going to the earlier seed. Returns it with per seed stats, or None if cancelled.
+    The pool is shared by all calls with the same aspect_rels and max_workers. Cancelling
+    terminates its workers, the seeds still running stop with them and the next call
+    starts a new pool. A call whose pool was terminated that way starts over on a new one.
+    """
+    results = None
+    while (results == None):
+        pool = _shared_pool(aspect_rels, max_workers or os.cpu_count() or 1)
+        submitted = [pool.apply_async(_solve_seed, (grid, placed_aspects, seed)) for seed in seeds]
+        pending = submitted
+        while (pending and _pool is pool):
+            if (cancel != None and cancel.is_set()):
+                _terminate_pool(pool)
+                return None
+            pending[0].wait(0.1)
+            pending = [result for result in pending if not result.ready()]
+        if (not pending):
+            results = [result.get() for result in submitted]
+
+    best = dict(placed_aspects)
+    best_key = None
+    for i, (solved, stats) in enumerate(results):
+        key = (not stats["complete"], stats["cost"], i)
+        if (best_key == None or key < best_key):
+            best = solved
+            best_key = key
+    return best, [stats for _, stats in results]
+
+class IncrementalSolver:
+    """
+    FAST/SLOW solver that keeps its solution between solves. update() diffs the board against
+    the last one: connections whose cells were removed, changed or disabled are dropped along
+    with the connections hanging off them, and only the sets left apart are linked again.
+
+    Searches are memoized on their start and end aspects, which are all the aspects on the board
+    at the time. A memoized connection stays valid while no cell on it gets disabled and no cell
+    gets enabled, so toggling an aspect on and off again reuses the earlier searches.
+    """
+    MAX_SEARCHES = 4096
+
+    def __init__(self, aspect_rels: AspectRelations, solver_mode: SolverMode = SolverMode.SLOW, rng: random.Random | None = None):
+        self.aspect_rels = aspect_rels
+        self.solver_mode = solver_mode
+        self.rng = rng or random.Random()
+        self.grid : HexGrid | None = None
+        # the aspects the solver did not add, and the connections it did add including their ends
+        self.user_aspects : dict[int, str] = {}
+        self.connections : list[list[tuple[int, str]]] = []
+        self.solved_aspects : dict[int, str] = {}
+        self.searches : dict[tuple[frozenset, frozenset], list[tuple[int, str]] | None] = {}
+        self.search_hits = 0
+        self.search_misses = 0
+        # a cancelled job may still be running when the next one starts
+        self._lock = threading.Lock()
+
+    def update(self, grid: HexGrid, placed_aspects: dict[int, str], cancel: threading.Event | None = None, user_aspects: dict[int, str] | None = None) -> dict[int, str] | None:
+        """
+        Returns placed_aspects plus the aspects connecting them, or None if cancelled.
+        placed_aspects may contain the aspects of the last returned solution. user_aspects are
+        the ones the user placed, the others the solver did not add itself (a solution from the
+        cache or another mode) are rerouted. None takes all of those as placed by the user.
+        """
+        with self._lock:
+            if (self.grid == None or self.grid.radius != grid.radius):
+                self.grid = None
+                self.connections = []
+                self.solved_aspects = {}
+                self.searches.clear()
+            previous_grid = self.grid
+            self.grid = grid.copy()
+            self._drop_broken(placed_aspects, user_aspects)
+            if (previous_grid != None and previous_grid.disabled_mask != grid.disabled_mask):
+                self._invalidate_searches(previous_grid.disabled_mask, grid.disabled_mask)
+
+            connections = _connect_greedy(self.grid, self.aspect_rels, self.solved_aspects, self.solver_mode, self.rng, cancel, self._search)
+            if (connections == None):
+                return None
+            self.connections += connections
+            return dict(self.solved_aspects)
+
+    def _drop_broken(self, placed_aspects: dict[int, str], user_aspects: dict[int, str] | None):
+        if (user_aspects == None):
+            added = {x: aspect for connection in self.connections for x, aspect in connection[1:-1]}
+            self.user_aspects = {x: aspect for x, aspect in placed_aspects.items() if added.get(x) != aspect}
+        else:
+            self.user_aspects = dict(user_aspects)
+        # dropping a connection can strand the ones ending on its cells, repeat until nothing changes
+        while True:
+            present = dict(self.user_aspects)
+            for connection in self.connections:
+                present.update(connection[1:-1])
+            kept = [connection for connection in self.connections
+                    if all([present.get(x) == aspect and placed_aspects.get(x) == aspect and not self.grid.is_disabled(x) for x, aspect in connection])]
+            if (len(kept) == len(self.connections)):
+                break
+            self.connections = kept
+        self.solved_aspects = present
+
+    def _invalidate_searches(self, previous_disabled: int, disabled: int):
+        if (previous_disabled & ~disabled):
+            # an enabled cell may open a cheaper connection for any search
+            self.searches.clear()
+            return
+        blocked_mask = disabled & ~previous_disabled
+        for key, connection in list(self.searches.items()):
+            if (connection != None and self.grid.nodes_to_mask([x for x, _ in connection]) & blocked_mask):
+                del self.searches[key]
+
+    def _search(self, starts: list[int], ends: list[int]) -> list[tuple[int, str]] | None:
+        key = (frozenset([(x, self.solved_aspects[x]) for x in starts]), frozenset([(x, self.solved_aspects[x]) for x in ends]))
+        if (key in self.searches):
+            self.search_hits += 1
+            return self.searches[key]
+        self.search_misses += 1
+        if (len(self.searches) >= self.MAX_SEARCHES):
+            self.searches.clear()
+        connection = find_cheapest_connection(self.grid, self.aspect_rels, self.solved_aspects, starts, ends)
+        self.searches[key] = connection
+        return connection
+
+class SolveJob:
+    """
+    Runs solve() on a snapshot of the board in a worker thread.
+    The board the job was started from is never touched, result holds the solved
+    placed aspects once done() and is left None when cancelled. ANYTIME jobs also
+    publish each improvement in best while running. With instrumented the solve runs
+    under instrument.collect() and its numbers end up in instrumentation.
+    """
+    def __init__(self, grid: HexGrid, aspect_rels: AspectRelations, placed_aspects: dict[int, str], solver_mode: SolverMode, incremental: IncrementalSolver | None = None, deadline_ms: float = DEFAULT_DEADLINE_MS, instrumented: bool = False, profile: bool = False, user_aspects: dict[int, str] | None = None):
+        self.grid = grid.copy()
+        self.aspect_rels = aspect_rels
+        self.placed_aspects = dict(placed_aspects)
+        self.solver_mode = solver_mode
+        # repairs the previous solution instead of starting over, FAST and SLOW only
+        self.incremental = incremental if solver_mode in [SolverMode.FAST, SolverMode.SLOW] else None
+        # the aspects of placed_aspects the user placed, see IncrementalSolver.update
+        self.user_aspects = None if user_aspects == None else dict(user_aspects)
+        self.deadline_ms = deadline_ms
+        self.result : dict[int, str] | None = None
+        # latest ANYTIME solution while it keeps improving, replaced and never modified
+        self.best : dict[int, str] | None = None
+        # per seed stats of a MULTI_START solve
+        self.stats : list[dict] = []
+        self.error : Exception | None = None
+        self.instrumented = instrumented
+        self.profile = profile
+        self.instrumentation : instrument.Instrumentation | None = None
+        self.start_time = time.perf_counter()
+        self.end_time : float | None = None
+        self._cancel = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="solve job", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        try:
+            if (self.instrumented):
+                with instrument.collect(self.profile) as instrumentation:
+                    self._solve()
+                self.instrumentation = instrumentation
+            else:
+                self._solve()
+        except Exception as e:
+            self.error = e
+        finally:
+            self.end_time = time.perf_counter()
+
+    def _solve(self):
+        if (self.solver_mode == SolverMode.MULTI_START):
+            result = solve_multi_start(self.grid, self.aspect_rels, self.placed_aspects, default_seeds(), self._cancel)
+            if (result != None):
+                self.result, self.stats = result
+        elif (self.solver_mode == SolverMode.ANYTIME):
+            for solution in solve_anytime(self.grid, self.aspect_rels, self.placed_aspects, self.deadline_ms, self._cancel):
+                self.best = solution
+            if (not self.cancelled()):
+                self.result = self.best
+        elif (self.incremental != None):
+            self.incremental.solver_mode = self.solver_mode
+            self.result = self.incremental.update(self.grid, self.placed_aspects, self._cancel, self.user_aspects)
+        else:
+            self.result = solve(self.grid, self.aspect_rels, self.placed_aspects, self.solver_mode, self._cancel)
+
+    def cancel(self):
+        self._cancel.set()
+
+    def cancelled(self) -> bool:
+        return self._cancel.is_set()
+
+    def done(self) -> bool:
+        return self.end_time != None
+
+    def elapsed(self) -> float:
+        return (self.end_time or time.perf_counter()) - self.start_time
@@ -0,0 +1,113 @@
+"""
+The set and list based HexGrid from before the bitmask rewrite, kept as the reference
+that tests compare the current HexGrid against
+"""
+from heapq import heappush, heappop
+
+class ReferenceHexGrid:
+    """
+    Axial hex coordinates (q, r)
+    """
+    def __init__(self, radius: int):
+        self.radius = max(0, radius - 1)
+        self.id_to_coord : dict[int, (int,int)] = {}
+        self.coord_to_id : dict[(int,int), int] = {}
+        self.adj : dict[int, list[int]] = {}
+        self.disabled_nodes : set[int] = set()
+        self._build()
+
+    def _build(self):
+        rad = self.radius
+        # create nodes inside axial radius
+        nid = 0
+        for q in range(-rad, rad + 1):
+            s1 = max(-rad, -q - rad)
+            s2 = min(rad, -q + rad)
+            for r in range(s1, s2 + 1):
+                coord = (q, r)
+                self.id_to_coord[nid] = coord
+                self.coord_to_id[coord] = nid
+                self.adj[nid] = []
+                nid += 1
+
+        # axial neighbor directions
+        dirs = [(1, 0), (1, -1), (0, -1), (-1, 0), (-1, 1), (0, 1)]
+        for i, coord in self.id_to_coord.items():
+            q, r = coord
+            for dq, dr in dirs:
+                ncoord = (q + dq, r + dr)
+                if ncoord in self.coord_to_id:
+                    nid = self.coord_to_id[ncoord]
+                    self.adj[i].append(nid)
+
+    def disable_id(self, node_id: int):
+        if (node_id in self.id_to_coord):
+            self.disabled_nodes.add(node_id)
+
+    def enable_id(self, node_id: int):
+        if (node_id in self.disabled_nodes):
+            self.disabled_nodes.remove(node_id)
+
+    def neighbors(self, node_id: int):
+        return list([x for x in self.adj.get(node_id, []) if not x in self.disabled_nodes])
+
+    def node_count(self):
+        return len([x for x in self.adj if not x in self.disabled_nodes])
+
+    def all_nodes(self):
+        return list([x for x in self.adj.keys() if not x in self.disabled_nodes])
+    
+    def find_path_minimum_length(self, start: int, ends: list[int], minimum_length: int, additional_excludes: list[int] = []) -> list[int] | None:
+        if (start in ends):
+            return None
+        if start not in self.adj or start in self.disabled_nodes:
+            return None
+        targets = {end for end in ends if end in self.adj and end not in self.disabled_nodes}
+        if not targets:
+            return None
+        
+        additional_excludes.remove(start)
+        for x in ends:
+            additional_excludes.remove(x)
+
+        queue = []
+        heappush(queue, (1, start, [start]))
+        min_len = max(0, minimum_length)
+
+        best_path = None
+        best_distance = 9999999
+
+        while queue:
+            distance, node, path = heappop(queue)
+            if node in targets and distance >= min_len and distance < best_distance:
+                best_path = path
+                best_distance = distance
+            if (distance >= best_distance):
+                continue
+            if (any([end in path for end in targets])):
+                continue
+            for neighbor in self.neighbors(node):
+                if (neighbor in path) or (neighbor in additional_excludes):
+                    continue
+                heappush(queue, (distance + 1, neighbor, path + [neighbor]))
+        return best_path
+
+    def split_contiguous_nodes(self, nodes: set[int]) -> list[set[int]]:
+        valid_nodes = {n for n in nodes if n in self.adj and n not in self.disabled_nodes}
+        components: list[set[int]] = []
+        visited: set[int] = set()
+        for node in valid_nodes:
+            if node in visited:
+                continue
+            component: set[int] = set()
+            stack = [node]
+            visited.add(node)
+            while stack:
+                current = stack.pop()
+                component.add(current)
+                for neighbor in self.neighbors(current):
+                    if neighbor in valid_nodes and neighbor not in visited:
+                        visited.add(neighbor)
+                        stack.append(neighbor)
+            components.append(component)
+        return components
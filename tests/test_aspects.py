@@ -0,0 +1,66 @@
+import random
+from pathlib import Path
+import pytest
+from algo import AspectRelations, ChainSearchExhausted
+
+def test_snapshot_matches_build(tmp_path: Path):
+    built = AspectRelations(cache_dir=tmp_path)
+    loaded = AspectRelations(cache_dir=tmp_path)
+    for name in AspectRelations.SNAPSHOT_ARRAYS[1:]:
+        assert (getattr(built, name) == getattr(loaded, name)).all()
+    assert built.aspect_names == loaded.aspect_names
+    assert [p.name for p in tmp_path.iterdir()] == [built.source_hash()]
+
+def test_saving_deletes_stale_snapshots(tmp_path: Path):
+    stale = AspectRelations(max_chain_length=5, cache_dir=tmp_path)
+    current = AspectRelations(cache_dir=tmp_path)
+    assert [p.name for p in tmp_path.iterdir()] == [current.source_hash()]
+    assert stale.find_path_exact_length("aer", "terra", 3) == current.find_path_exact_length("aer", "terra", 3)
+
+def test_unwritable_cache_dir_keeps_build(tmp_path: Path):
+    blocker = tmp_path / "file"
+    blocker.write_text("")
+    aspect_rels = AspectRelations(cache_dir=blocker / "cache")
+    assert len(aspect_rels.aspect_names) > 0 and len(aspect_rels.chain_costs) == 21
+    assert list(tmp_path.iterdir()) == [blocker]
+
+def cheapest_simple_chain(aspect_rels: AspectRelations, start: int, end: int, length: int) -> int | None:
+    # every simple chain of exactly length hops, the cost of the cheapest
+    best = None
+    def visit(path: list[int]):
+        nonlocal best
+        if (len(path) == length + 1):
+            if (path[-1] == end):
+                cost = int(sum(aspect_rels.cost_array[path]))
+                best = cost if best == None else min(best, cost)
+            return
+        for neighbor in aspect_rels.neighbor_ids(path[-1]).tolist():
+            if (neighbor not in path):
+                visit(path + [neighbor])
+    visit([start])
+    return best
+
+def test_find_chain_ids_matches_enumeration():
+    aspect_rels = AspectRelations(cache_dir=None)
+    rng = random.Random(1)
+    count = len(aspect_rels.aspect_names)
+    for _ in range(60):
+        start, end = rng.randrange(count), rng.randrange(count)
+        for length in range(8):
+            expected = cheapest_simple_chain(aspect_rels, start, end, length)
+            path = aspect_rels.find_chain_ids(start, end, length)
+            if (expected == None):
+                assert path == None
+                continue
+            assert path != None and len(path) == length + 1 and len(set(path)) == len(path)
+            assert path[0] == start and path[-1] == end
+            assert all([b in aspect_rels.neighbor_ids(a) for a, b in zip(path, path[1:])])
+            assert int(sum(aspect_rels.cost_array[path])) == expected
+
+def test_find_chain_ids_reports_exhausted_budget():
+    aspect_rels = AspectRelations(cache_dir=None)
+    # a long chain whose cheapest table entry repeats an aspect, so the search runs
+    start, end = aspect_rels.aspect_ids["aer"], aspect_rels.aspect_ids["terra"]
+    with pytest.raises(ChainSearchExhausted):
+        aspect_rels.find_chain_ids(start, end, 18, max_expansions=10)
+    assert aspect_rels.find_chain_ids(start, end, 18, max_expansions=None) != None
@@ -0,0 +1,25 @@
+import pytest
+from algo import AspectRelations
+from puzzles import generate_corpus
+from solver import board_from_json, board_to_json
+
+@pytest.fixture(scope="module")
+def aspect_rels() -> AspectRelations:
+    return AspectRelations(cache_dir=None)
+
+def test_boards_round_trip(aspect_rels: AspectRelations):
+    for board in generate_corpus(1, 3, [2, 5, 8], aspect_rels):
+        grid, placed = board_from_json(board, aspect_rels)
+        again, placed_again = board_from_json(board_to_json(grid, placed), aspect_rels)
+        assert again.disabled_mask == grid.disabled_mask and placed_again == placed
+
+@pytest.mark.parametrize("board", [
+    {"grid_size": 3, "placed": [[3, 0, "aer"]]},
+    {"grid_size": 3, "disabled": [[0, 5]]},
+    {"grid_size": 3, "placed": [[0, 0, "nothing"]]},
+    {"grid_size": 3, "disabled": [[0, 0]], "placed": [[0, 0, "aer"]]},
+    {"grid_size": 3, "placed": [[0, 0, "aer"], [0, 0, "terra"]]},
+])
+def test_bad_boards_raise(aspect_rels: AspectRelations, board: dict):
+    with pytest.raises(ValueError):
+        board_from_json(board, aspect_rels)
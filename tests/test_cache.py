@@ -0,0 +1,50 @@
+import pytest
+from algo import HexGrid
+from cache import SolutionCache, _inverse_transform, _transform, board_key
+from solver import SolverMode
+
+def transformed_board(index: int, grid: HexGrid, placed_aspects: dict[int, str]) -> tuple[HexGrid, dict[int, str]]:
+    moved = HexGrid(grid.radius + 1)
+    move = lambda node: moved.coord_to_id[_transform(index, grid.id_to_coord[node])]
+    for node in grid.disabled_nodes:
+        moved.disable_id(move(node))
+    return moved, {move(node): aspect for node, aspect in placed_aspects.items()}
+
+def sample_board() -> tuple[HexGrid, dict[int, str]]:
+    grid = HexGrid(4)
+    grid.disable_id(grid.coord_to_id[(1, 0)])
+    grid.disable_id(grid.coord_to_id[(2, -1)])
+    placed = {grid.coord_to_id[(-3, 1)]: "aer", grid.coord_to_id[(2, 1)]: "terra", grid.coord_to_id[(0, -3)]: "ignis"}
+    return grid, placed
+
+def test_transforms_are_distinct_symmetries():
+    grid = HexGrid(4)
+    images = set()
+    for index in range(12):
+        mapped = [_transform(index, coord) for coord in grid.id_to_coord.values()]
+        assert sorted(mapped) == sorted(grid.id_to_coord.values())
+        assert all([_inverse_transform(index, _transform(index, coord)) == coord for coord in grid.id_to_coord.values()])
+        images.add(tuple(mapped))
+    assert len(images) == 12
+
+def test_board_key_is_shared_by_all_symmetries():
+    grid, placed = sample_board()
+    key, _ = board_key(grid, placed, SolverMode.SLOW)
+    for index in range(12):
+        assert board_key(*transformed_board(index, grid, placed), SolverMode.SLOW)[0] == key
+    assert board_key(grid, placed, SolverMode.FAST)[0] != key
+
+@pytest.mark.parametrize("index", range(12))
+def test_hit_maps_solution_onto_symmetric_board(index: int):
+    grid, placed = sample_board()
+    solved = dict(placed)
+    solved[grid.coord_to_id[(-2, 1)]] = "lux"
+    solved[grid.coord_to_id[(0, 0)]] = "motus"
+    cache = SolutionCache()
+    cache.put(grid, placed, SolverMode.SLOW, solved)
+
+    moved, moved_placed = transformed_board(index, grid, placed)
+    hit = cache.get(moved, moved_placed, SolverMode.SLOW)
+    expected = {moved.coord_to_id[_transform(index, grid.id_to_coord[node])]: aspect for node, aspect in solved.items()}
+    assert hit == expected
+    assert cache.hits == 1 and cache.misses == 0
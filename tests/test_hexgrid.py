@@ -0,0 +1,124 @@
+import random
+import numpy as np
+import pytest
+from algo import UNREACHABLE, HexGrid, mask_ids
+from reference_grid import ReferenceHexGrid
+
+def random_boards(seed: int, sizes: list[int], count: int):
+    # the same disabled cells on a current and a reference grid
+    rng = random.Random(seed)
+    for size in sizes:
+        for _ in range(count):
+            grid = HexGrid(size)
+            reference = ReferenceHexGrid(size)
+            nodes = grid.all_nodes()
+            for node in rng.sample(nodes, rng.randint(0, len(nodes) // 4)):
+                grid.disable_id(node)
+                reference.disable_id(node)
+            yield rng, grid, reference
+
+def is_path(grid: HexGrid, path: list[int]) -> bool:
+    return len(set(path)) == len(path) and all([b in grid.neighbors(a) for a, b in zip(path, path[1:])])
+
+def test_layout_matches_reference():
+    for _, grid, reference in random_boards(1, [1, 2, 3, 5, 8], 4):
+        assert grid.node_count() == reference.node_count()
+        assert grid.all_nodes() == sorted(reference.all_nodes())
+        assert grid.disabled_nodes == reference.disabled_nodes
+        for node in range(len(grid.id_to_coord) + 1):
+            assert sorted(grid.neighbors(node)) == sorted(reference.neighbors(node))
+
+def test_split_contiguous_nodes_matches_reference():
+    for rng, grid, reference in random_boards(2, [2, 3, 5, 8], 6):
+        for _ in range(8):
+            nodes = set(rng.sample(range(len(grid.id_to_coord)), rng.randint(0, len(grid.id_to_coord))))
+            components = sorted([sorted(c) for c in grid.split_contiguous_nodes(nodes)])
+            assert components == sorted([sorted(c) for c in reference.split_contiguous_nodes(nodes)])
+
+def test_find_path_minimum_length_matches_reference():
+    # the reference search is exhaustive, so the boards stay small
+    for rng, grid, reference in random_boards(3, [2, 3, 4], 8):
+        free = grid.all_nodes()
+        for _ in range(6):
+            placed = rng.sample(free, min(len(free), rng.randint(2, 4)))
+            start, ends = placed[0], placed[1:]
+            minimum_length = rng.randint(0, 6)
+            path = grid.find_path_minimum_length(start, ends, minimum_length, list(placed))
+            expected = reference.find_path_minimum_length(start, ends, minimum_length, list(placed))
+            if (expected == None):
+                assert path == None
+                continue
+            # ties between equally long paths may be broken differently
+            assert path != None and len(path) == len(expected)
+            assert path[0] == start and path[-1] in ends and is_path(grid, path)
+            assert not set(path[1:-1]) & set(placed)
+
+def test_find_path_minimum_length_rejects_bad_ends():
+    grid = HexGrid(3)
+    grid.disable_id(1)
+    assert grid.find_path_minimum_length(0, [0, 5], 2) == None
+    assert grid.find_path_minimum_length(1, [5], 2) == None
+    assert grid.find_path_minimum_length(0, [1], 2) == None
+
+@pytest.mark.parametrize("size", [3, 6, 11])
+def test_incremental_distances_match_rebuild(size: int):
+    rng = random.Random(size)
+    grid = HexGrid(size)
+    assert (grid.distances == grid._bfs_rows(np.arange(len(grid.id_to_coord)))).all()
+    nodes = grid.all_nodes()
+    for _ in range(3 * size):
+        node = rng.choice(nodes)
+        if (grid.is_disabled(node)):
+            grid.enable_id(node)
+        else:
+            grid.disable_id(node)
+        fresh = HexGrid(size)
+        for disabled in grid.disabled_nodes:
+            fresh.disable_id(disabled)
+        assert (grid.distances == fresh.distances).all()
+        assert (grid.distances[node] == UNREACHABLE).all() == grid.is_disabled(node)
+
+def test_copy_keeps_distances_separate():
+    grid = HexGrid(4)
+    distances = grid.distances.copy()
+    copy = grid.copy()
+    copy.disable_id(0)
+    assert (grid.distances == distances).all()
+    assert not grid.is_disabled(0) and copy.is_disabled(0)
+
+def test_copies_share_built_distances():
+    grid = HexGrid(5)
+    grid.disable_id(0)
+    grid.disable_id(30)
+    first = grid.copy()
+    distances = first.distances
+    second = grid.copy()
+    assert second._distances is None
+    assert (second.distances == distances).all()
+    second.disable_id(10)
+    assert (grid.copy().distances == distances).all()
+    fresh = HexGrid(5)
+    for node in [0, 10, 30]:
+        fresh.disable_id(node)
+    assert (second.distances == fresh.distances).all()
+
+def test_copies_derive_distances_from_the_cache():
+    # the live grid in the UI never builds distances, copies after a few clicks update the cached matrix
+    rng = random.Random(7)
+    grid = HexGrid(8)
+    for node in rng.sample(grid.all_nodes(), 30):
+        grid.disable_id(node)
+    grid.copy().distances
+    for step in range(10):
+        if (step % 2):
+            for node in rng.sample(sorted(grid.disabled_nodes), 2):
+                grid.enable_id(node)
+            # enabled cells never need a rebuild
+            assert grid.copy()._derived_distances() is not None
+        else:
+            for node in rng.sample(list(mask_ids(grid.enabled_mask())), 2):
+                grid.disable_id(node)
+        fresh = grid.copy()
+        fresh._distance_cache = {}
+        assert (grid.copy().distances == fresh.distances).all()
+        assert list(grid._distance_cache) == [grid.disabled_mask]
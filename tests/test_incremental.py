@@ -0,0 +1,56 @@
+import random
+import pytest
+from algo import AspectRelations, HexGrid
+from solver import IncrementalSolver, SolverMode, is_connected, solve
+
+@pytest.fixture(scope="module")
+def aspect_rels() -> AspectRelations:
+    return AspectRelations(cache_dir=None)
+
+def board() -> tuple[HexGrid, dict[int, str]]:
+    grid = HexGrid(5)
+    return grid, {grid.coord_to_id[(-4, 0)]: "aer", grid.coord_to_id[(4, 0)]: "terra", grid.coord_to_id[(0, 4)]: "ignis", grid.coord_to_id[(0, -4)]: "aqua"}
+
+def added_cells(connections: list[list[tuple[int, str]]]) -> set[int]:
+    return {x for connection in connections for x, _ in connection[1:-1]}
+
+def test_removed_aspect_drops_its_connections(aspect_rels: AspectRelations):
+    grid, placed = board()
+    solver = IncrementalSolver(aspect_rels, rng=random.Random(1))
+    solved = solver.update(grid, placed)
+    assert is_connected(grid, solved)
+    removed = grid.coord_to_id[(0, -4)]
+    previous = list(solver.connections)
+    solved.pop(removed)
+    repaired = solver.update(grid, solved)
+    assert removed not in repaired and is_connected(grid, repaired)
+    # the connections off the removed aspect are gone, the others stay where they were
+    kept = [c for c in previous if c in solver.connections]
+    assert kept and all([removed not in [x for x, _ in c] for c in solver.connections])
+    assert added_cells(solver.connections) == set(repaired) - set(placed)
+
+def test_disabled_cell_reroutes_and_invalidates(aspect_rels: AspectRelations):
+    grid, placed = board()
+    solver = IncrementalSolver(aspect_rels, rng=random.Random(1))
+    solved = solver.update(grid, placed)
+    blocked = next(iter(added_cells(solver.connections)))
+    grid.disable_id(blocked)
+    solved.pop(blocked)
+    rerouted = solver.update(grid, solved)
+    assert blocked not in rerouted and is_connected(grid, rerouted)
+    assert all([blocked not in [x for x, _ in c] for c in solver.searches.values() if c != None])
+    # an enabled cell may open cheaper connections for every search
+    grid.enable_id(blocked)
+    assert solver.update(grid, rerouted) == rerouted
+    assert solver.searches == {}
+
+def test_foreign_solution_is_rerouted(aspect_rels: AspectRelations):
+    # a solution from the cache or another mode, then the user removes one of their aspects
+    grid, placed = board()
+    foreign = solve(grid, aspect_rels, placed, SolverMode.SLOW, rng=random.Random(2))
+    removed = grid.coord_to_id[(0, -4)]
+    user_aspects = {x: aspect for x, aspect in placed.items() if x != removed}
+    shown = {x: aspect for x, aspect in foreign.items() if x != removed}
+    repaired = IncrementalSolver(aspect_rels, rng=random.Random(3)).update(grid, shown, user_aspects=user_aspects)
+    fresh = IncrementalSolver(aspect_rels, rng=random.Random(3)).update(grid, user_aspects)
+    assert repaired == fresh
@@ -0,0 +1,44 @@
+import threading
+import instrument
+from algo import HexGrid
+
+def test_split_contiguous_nodes_counts_expanded_nodes():
+    grid = HexGrid(3)
+    with instrument.collect() as stats:
+        grid.split_contiguous_nodes({0, 1, 2, 10})
+    operation = stats.report()["operations"]["split_contiguous_nodes"]
+    assert operation["calls"] == 1 and operation["expanded"] == 4 and operation["queue_peak"] >= 1
+
+def test_nested_collect_restores_outer():
+    grid = HexGrid(3)
+    with instrument.collect() as outer:
+        with instrument.collect() as inner:
+            grid.split_contiguous_nodes({0})
+        assert instrument.active() is outer
+        grid.split_contiguous_nodes({0})
+    assert instrument.active() == None
+    assert inner.operations["split_contiguous_nodes"]["calls"] == 1
+    assert outer.operations["split_contiguous_nodes"]["calls"] == 1
+
+def test_collect_is_per_thread():
+    grid = HexGrid(3)
+    started = threading.Event()
+    finish = threading.Event()
+
+    def other():
+        with instrument.collect() as stats:
+            started.set()
+            finish.wait()
+            grid.split_contiguous_nodes({0})
+        assert stats.operations["split_contiguous_nodes"]["calls"] == 1
+
+    thread = threading.Thread(target=other)
+    thread.start()
+    started.wait()
+    with instrument.collect() as stats:
+        finish.set()
+        thread.join()
+        grid.split_contiguous_nodes({0})
+        grid.split_contiguous_nodes({1})
+    assert stats.operations["split_contiguous_nodes"]["calls"] == 2
+    assert instrument.active() == None
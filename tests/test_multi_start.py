@@ -0,0 +1,36 @@
+import multiprocessing
+import threading
+import pytest
+import solver
+from algo import AspectRelations, HexGrid
+from solver import solve_multi_start
+
+@pytest.fixture(scope="module")
+def aspect_rels() -> AspectRelations:
+    return AspectRelations(cache_dir=None)
+
+def board() -> tuple[HexGrid, dict[int, str]]:
+    grid = HexGrid(4)
+    return grid, {grid.coord_to_id[(-3, 0)]: "aer", grid.coord_to_id[(3, 0)]: "terra", grid.coord_to_id[(0, 3)]: "ignis"}
+
+def test_solves_share_one_pool(aspect_rels: AspectRelations):
+    grid, placed = board()
+    first, stats = solve_multi_start(grid, aspect_rels, placed, [0, 1, 2], max_workers=2)
+    pool = solver._pool
+    second, _ = solve_multi_start(grid, aspect_rels, placed, [0, 1, 2], max_workers=2)
+    assert solver._pool is pool and first == second
+    assert [s["seed"] for s in stats] == [0, 1, 2] and all([s["complete"] for s in stats])
+
+def test_cancel_terminates_workers(aspect_rels: AspectRelations):
+    grid, placed = board()
+    solve_multi_start(grid, aspect_rels, placed, [0], max_workers=2)
+    workers = multiprocessing.active_children()
+    assert workers
+    cancel = threading.Event()
+    cancel.set()
+    assert solve_multi_start(grid, aspect_rels, placed, [0, 1], cancel, max_workers=2) == None
+    assert solver._pool == None
+    for worker in workers:
+        worker.join(5)
+        assert not worker.is_alive()
+    assert solve_multi_start(grid, aspect_rels, placed, [0], max_workers=2) != None
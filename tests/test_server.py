@@ -0,0 +1,102 @@
+import asyncio
+import json
+import time
+from pathlib import Path
+import pytest
+from algo import AspectRelations, HexGrid
+from cache import SolutionCache
+from server import RemoteSolveJob, SolveServer
+from solver import SolverMode, board_to_json
+
+@pytest.fixture(scope="module")
+def aspect_rels() -> AspectRelations:
+    return AspectRelations(cache_dir=None)
+
+def board(board_id: str, mode: str = "slow") -> dict:
+    grid = HexGrid(4)
+    placed = {grid.coord_to_id[(-3, 0)]: "aer", grid.coord_to_id[(3, 0)]: "terra", grid.coord_to_id[(0, 3)]: "ignis"}
+    return {"id": board_id, **board_to_json(grid, placed), "mode": mode, "seed": 1}
+
+def serving(aspect_rels: AspectRelations, path: Path, client) -> SolveServer:
+    # the server and client on one event loop, the workers are spawned so they import this module again
+    server = SolveServer(aspect_rels, SolutionCache(), workers=1)
+
+    async def run():
+        started = asyncio.Event()
+        serve = asyncio.create_task(server.serve(str(path), started))
+        await asyncio.wait([asyncio.create_task(started.wait()), serve], return_when=asyncio.FIRST_COMPLETED)
+        try:
+            await client(str(path))
+        finally:
+            serve.cancel()
+            await asyncio.gather(serve, return_exceptions=True)
+
+    asyncio.run(run())
+    return server
+
+async def exchange(path: str, lines: list[str], answers: int) -> list[dict]:
+    reader, writer = await asyncio.open_unix_connection(path)
+    # all lines in one write, the server reads the next board before answering the first
+    writer.write("".join([line + "\n" for line in lines]).encode("utf-8"))
+    await writer.drain()
+    received = [json.loads(await asyncio.wait_for(reader.readline(), 60)) for _ in range(answers)]
+    writer.close()
+    return received
+
+def test_pipelined_boards_are_answered_by_id(aspect_rels: AspectRelations, tmp_path: Path):
+    received = []
+
+    async def client(path: str):
+        received.extend(await exchange(path, [json.dumps(board("a")), json.dumps({**board("b"), "seed": 2})], 4))
+
+    server = serving(aspect_rels, tmp_path / "sock", client)
+    done = {answer["id"]: answer for answer in received if answer["status"] == "done"}
+    assert sorted(done) == ["a", "b"] and all([answer["complete"] for answer in done.values()])
+    assert server.solves == 2 and server.coalesced == 0
+
+def test_identical_boards_are_solved_once(aspect_rels: AspectRelations, tmp_path: Path):
+    received = []
+
+    async def client(path: str):
+        received.extend(await exchange(path, [json.dumps(board("a")), json.dumps(board("b"))], 4))
+
+    server = serving(aspect_rels, tmp_path / "sock", client)
+    done = {answer["id"]: answer for answer in received if answer["status"] == "done"}
+    assert sorted(done) == ["a", "b"] and done["a"]["added"] == done["b"]["added"]
+    assert server.solves == 1 and server.coalesced == 1
+
+def test_bad_boards_get_errors(aspect_rels: AspectRelations, tmp_path: Path):
+    received = []
+
+    async def client(path: str):
+        lines = ["not json", json.dumps({**board("a"), "placed": [[0, 0, "nothing"]]}), json.dumps({**board("b"), "mode": "nope"})]
+        received.extend(await exchange(path, lines, 3))
+
+    serving(aspect_rels, tmp_path / "sock", client)
+    assert [answer["status"] for answer in received] == ["error"] * 3
+    assert sorted([str(answer["id"]) for answer in received]) == ["None", "a", "b"]
+
+def test_multi_start_runs_on_the_server_pool(aspect_rels: AspectRelations, tmp_path: Path):
+    received = []
+
+    async def client(path: str):
+        received.extend(await exchange(path, [json.dumps(board("a", "multi_start"))], 2))
+
+    serving(aspect_rels, tmp_path / "sock", client)
+    assert received[-1]["status"] == "done" and received[-1]["complete"]
+
+def test_remote_job_cancelled_right_away_stops(aspect_rels: AspectRelations, tmp_path: Path):
+    jobs = []
+
+    async def client(path: str):
+        grid = HexGrid(4)
+        placed = {grid.coord_to_id[(-3, 0)]: "aer", grid.coord_to_id[(3, 0)]: "terra"}
+        job = RemoteSolveJob(path, grid, aspect_rels, placed, SolverMode.SLOW)
+        job.cancel()
+        jobs.append(job)
+        start_time = time.perf_counter()
+        while (not job.done() and time.perf_counter() - start_time < 10):
+            await asyncio.sleep(0.01)
+
+    serving(aspect_rels, tmp_path / "sock", client)
+    assert jobs[0].done() and jobs[0].result == None and jobs[0].error == None
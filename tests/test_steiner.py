@@ -0,0 +1,95 @@
+import itertools
+import random
+import pytest
+from algo import UNREACHABLE, AspectRelations, HexGrid, SteinerConnection, find_cheapest_connection, set_lower_bounds
+from puzzles import generate_corpus
+from solver import SolverMode, board_from_json, is_connected, solution_cost, solve
+
+@pytest.fixture(scope="module")
+def aspect_rels() -> AspectRelations:
+    return AspectRelations(cache_dir=None)
+
+def is_linked(grid: HexGrid, aspect_rels: AspectRelations, placed_aspects: dict[int, str], solved_aspects: dict[int, str]) -> bool:
+    # every placed aspect reached over hex neighbors holding related aspects
+    start = next(iter(placed_aspects))
+    seen = {start}
+    stack = [start]
+    while stack:
+        node = stack.pop()
+        for neighbor in grid.neighbors(node):
+            if neighbor in solved_aspects and neighbor not in seen and solved_aspects[neighbor] in aspect_rels.aspect_relations[solved_aspects[node]]:
+                seen.add(neighbor)
+                stack.append(neighbor)
+    return set(placed_aspects) <= seen
+
+def test_two_terminals_match_cheapest_chain(aspect_rels: AspectRelations):
+    # on an open size 3 grid the cells from (-2, 0) to (2, 0) hold simple paths of 3 to 8
+    # intermediates, so the cheapest chain over those lengths is the exact optimum
+    grid = HexGrid(3)
+    start, end = grid.coord_to_id[(-2, 0)], grid.coord_to_id[(2, 0)]
+    rng = random.Random(5)
+    for _ in range(6):
+        a, b = rng.sample(aspect_rels.aspect_names, 2)
+        ids = (aspect_rels.aspect_ids[a], aspect_rels.aspect_ids[b])
+        aspect_rels._extend_chain_table(9)
+        expected = min([int(aspect_rels.chain_costs[k + 1, ids[0], ids[1]]) for k in range(3, 9)]) - aspect_rels.aspect_costs[a] - aspect_rels.aspect_costs[b]
+        placed = {start: a, end: b}
+        added = SteinerConnection(grid, aspect_rels, placed, time_limit=60.0).solve()
+        assert added != None
+        assert sum([aspect_rels.aspect_costs[x] for x in added.values()]) == expected
+        assert is_linked(grid, aspect_rels, placed, {**placed, **added})
+
+def test_exact_is_never_dearer_than_greedy(aspect_rels: AspectRelations):
+    rng = random.Random(7)
+    for _ in range(8):
+        grid = HexGrid(4)
+        for node in rng.sample(grid.all_nodes(), 4):
+            grid.disable_id(node)
+        # apart, adjacent placed cells count as one terminal whether or not they are related
+        cells = rng.sample(grid.all_nodes(), 3)
+        if (len(grid.split_contiguous_nodes(cells)) < 3):
+            continue
+        placed = {node: rng.choice(aspect_rels.aspect_names) for node in cells}
+        greedy = solve(grid.copy(), aspect_rels, placed, SolverMode.SLOW, rng=random.Random(0))
+        added = SteinerConnection(grid, aspect_rels, placed, time_limit=60.0).solve()
+        if (added == None):
+            assert greedy == None or not is_connected(grid, greedy)
+            continue
+        solved = {**placed, **added}
+        assert is_linked(grid, aspect_rels, placed, solved)
+        if (greedy != None and is_linked(grid, aspect_rels, placed, greedy)):
+            assert solution_cost(aspect_rels, placed, solved) <= solution_cost(aspect_rels, placed, greedy)
+
+def test_adjacent_related_terminals_need_nothing(aspect_rels: AspectRelations):
+    grid = HexGrid(2)
+    a = aspect_rels.aspect_names[0]
+    b = sorted(aspect_rels.aspect_relations[a])[0]
+    placed = {grid.coord_to_id[(0, 0)]: a, grid.coord_to_id[(1, 0)]: b}
+    assert SteinerConnection(grid, aspect_rels, placed).solve() == {}
+
+def test_cheapest_connection_is_exact_from_both_sides(aspect_rels: AspectRelations):
+    # the first board used to cost 49 from cognitio and 13 from tabernus
+    boards = [{"grid_size": 3, "disabled": [[-2, 2]], "placed": [[-2, 0, "tabernus"], [0, 0, "cognitio"]]}]
+    boards += generate_corpus(11, 4, [3, 4, 5], aspect_rels)
+    for board in boards:
+        grid, placed = board_from_json(board, aspect_rels)
+        for a, b in itertools.combinations(placed, 2):
+            pair = {a: placed[a], b: placed[b]}
+            if (len(grid.split_contiguous_nodes(pair.keys())) < 2):
+                continue
+            added = SteinerConnection(grid, aspect_rels, pair, time_limit=60.0).solve()
+            expected = None if added == None else sum([aspect_rels.aspect_costs[x] for x in added.values()])
+            for start, end in [(a, b), (b, a)]:
+                chain = find_cheapest_connection(grid, aspect_rels, pair, [start], [end])
+                assert (None if chain == None else sum([aspect_rels.aspect_costs[x] for _, x in chain[1:-1]])) == expected
+
+def test_set_lower_bounds_underestimate(aspect_rels: AspectRelations):
+    for board in generate_corpus(3, 4, [4, 6], aspect_rels):
+        grid, placed = board_from_json(board, aspect_rels)
+        sets = grid.split_contiguous_nodes(placed.keys())
+        bounds = set_lower_bounds(grid, aspect_rels, placed, sets)
+        for i, j in itertools.permutations(range(len(sets)), 2):
+            chain = find_cheapest_connection(grid, aspect_rels, placed, list(sets[i]), list(sets[j]))
+            if (chain != None):
+                assert bounds[i, j] <= sum([aspect_rels.aspect_costs[x] for _, x in chain[1:-1]])
+            assert bounds[i, j] < UNREACHABLE or chain == None